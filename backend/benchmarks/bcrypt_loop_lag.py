@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Event-loop latency under concurrent logins
+
+Runs N concurrent password verifications, first inline on the event loop
+(the old behaviour) and then on the bounded hashing pool. Meanwhile a probe
+task measures how late the event loop wakes it up.
+
+Usage (from the backend directory):
+    python benchmarks/bcrypt_loop_lag.py --logins 20 --rounds 12
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PROBE_INTERVAL = 0.01
+
+async def probe_loop_lag(samples: list, stop: asyncio.Event):
+    """Record how far past the requested sleep each wake-up lands"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+async def run_logins(label: str, verify, logins: int):
+    samples = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(samples, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(verify() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1] if len(samples) > 1 else samples[0]
+    print(f"{label:<24} total {elapsed * 1000:8.1f} ms | loop lag median "
+          f"{statistics.median(samples) * 1000:7.1f} ms, p99 {p99 * 1000:7.1f} ms, max {samples[-1] * 1000:7.1f} ms")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Event-loop latency under concurrent logins")
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    from services.auth_service import auth_service, pwd_context, password_hasher
+
+    password = "SecurePass123!"
+    hashed = pwd_context.hash(password)
+
+    async def inline_verify():
+        auth_service.verify_password(password, hashed)
+
+    async def pooled_verify():
+        await auth_service.verify_password_async(password, hashed)
+
+    print(f"{args.logins} concurrent logins, bcrypt rounds {args.rounds}, {password_hasher.workers} hashing workers")
+    await run_logins("Inline (blocking)", inline_verify, args.logins)
+    await run_logins("Hashing pool", pooled_verify, args.logins)
+    password_hasher.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
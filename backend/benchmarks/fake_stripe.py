@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Minimal offline stand-in for the Stripe Checkout Sessions API
+
+Implements POST /v1/checkout/sessions (form encoded, honours Idempotency-Key)
+and GET /v1/checkout/sessions/{id} with a configurable response latency.
+Point the backend at it with STRIPE_API_BASE=http://127.0.0.1:<port>.
+
+Usage (from the backend directory):
+    python benchmarks/fake_stripe.py --port 12111 --latency-ms 100
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs
+
+class FakeStripe:
+    def __init__(self, latency: float = 0.1):
+        self.latency = latency
+        self.sessions = {}
+        self.idempotent = {}
+        self.requests = 0
+
+    def _create_session(self, form: dict) -> dict:
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "url": f"https://checkout.stripe.test/pay/{session_id}",
+            "mode": form.get("mode", "payment"),
+            "payment_status": "unpaid",
+            "payment_intent": None,
+            "status": "open",
+            "amount_total": int(form.get("line_items[0][price_data][unit_amount]", 0)),
+            "currency": form.get("line_items[0][price_data][currency]", "usd"),
+            "metadata": {
+                key[len("metadata["):-1]: value
+                for key, value in form.items()
+                if key.startswith("metadata[")
+            },
+            "created": int(time.time())
+        }
+        self.sessions[session_id] = session
+        return session
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                status, payload = self.route(method, path, headers, body)
+
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\nRequest-Id: req_{uuid.uuid4().hex[:14]}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method: str, path: str, headers: dict, body: bytes):
+        path = path.split("?", 1)[0]
+        if method == "POST" and path == "/v1/checkout/sessions":
+            key = headers.get("idempotency-key")
+            if key and key in self.idempotent:
+                return "200 OK", self.idempotent[key]
+            form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+            session = self._create_session(form)
+            if key:
+                self.idempotent[key] = session
+            return "200 OK", session
+        if method == "GET" and path.startswith("/v1/checkout/sessions/"):
+            session = self.sessions.get(path.rsplit("/", 1)[1])
+            if session:
+                return "200 OK", session
+        return "404 Not Found", {"error": {"type": "invalid_request_error", "message": "No such resource"}}
+
+def start_in_thread(port: int = 0, latency: float = 0.1) -> tuple:
+    """Run a FakeStripe server on its own event loop thread; returns (fake, base_url)"""
+    fake = FakeStripe(latency)
+    ready = threading.Event()
+    bound = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(fake.handle, "127.0.0.1", port))
+        bound["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return fake, f"http://127.0.0.1:{bound['port']}"
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake Stripe Checkout API")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    fake = FakeStripe(args.latency_ms / 1000)
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", args.port)
+    print(f"Fake Stripe listening on http://127.0.0.1:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Concurrent balance updates: read-modify-write vs. the ledger
+
+Fires a burst of concurrent deposits and withdrawals at one wallet, first with
+the old pattern (read balance, add in Python, $set) and then through
+services/ledger_service.py (conditional $inc + double-entry entries). After
+each run it checks the final balance against the operations that reported
+success, that the balance never went negative, and that the ledger agrees
+with the balance and every transaction nets to zero.
+
+Needs a reachable MongoDB (MONGO_URL); transactions are used when it is a
+replica set. Usage (from the backend directory):
+    python benchmarks/ledger_stress.py --operations 2000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import database
+from services.ledger_service import (
+    ledger_service, InsufficientFundsError, LEDGER_COLLECTION, ADJUSTMENTS_ACCOUNT, user_account
+)
+
+BENCH_DB = "crib_markets_bench"
+USER_ID = "ledger-bench"
+OPENING_BALANCE = 1000.0
+
+def make_operations(count: int, seed: int):
+    """Whole-unit amounts so float addition order can't blur the comparison"""
+    rng = random.Random(seed)
+    return [rng.choice((1, -1)) * float(rng.randint(1, 50)) for _ in range(count)]
+
+async def reset(db):
+    await db.users.delete_many({"id": USER_ID})
+    await db[LEDGER_COLLECTION].delete_many({})
+    await db.users.insert_one({"id": USER_ID, "email": "ledger-bench@example.com", "balance": OPENING_BALANCE})
+
+async def read_modify_write(db, amount: float) -> bool:
+    user = await db.users.find_one({"id": USER_ID})
+    if user["balance"] + amount < 0:
+        return False
+    await db.users.update_one({"id": USER_ID}, {"$set": {"balance": user["balance"] + amount}})
+    return True
+
+async def ledger_post(db, amount: float) -> bool:
+    try:
+        await ledger_service.post(USER_ID, amount, ADJUSTMENTS_ACCOUNT, "bench")
+        return True
+    except InsufficientFundsError:
+        return False
+
+async def run(label: str, db, operation, amounts, concurrency: int) -> bool:
+    await reset(db)
+    semaphore = asyncio.Semaphore(concurrency)
+    lowest = [OPENING_BALANCE]
+
+    async def one(amount):
+        async with semaphore:
+            accepted = await operation(db, amount)
+            user = await db.users.find_one({"id": USER_ID}, {"balance": 1})
+            lowest[0] = min(lowest[0], user["balance"])
+            return accepted
+
+    started = time.perf_counter()
+    accepted = await asyncio.gather(*(one(amount) for amount in amounts))
+    elapsed = time.perf_counter() - started
+
+    expected = OPENING_BALANCE + sum(amount for amount, ok in zip(amounts, accepted) if ok)
+    balance = (await db.users.find_one({"id": USER_ID}))["balance"]
+    print(f"{label:<20} {elapsed * 1000:9.1f} ms | {len(amounts) / elapsed:8.0f} ops/s | "
+          f"accepted {sum(accepted)}/{len(amounts)} | balance {balance:.2f} expected {expected:.2f} | "
+          f"lost {expected - balance:+.2f} | lowest seen {lowest[0]:.2f}")
+    return balance == expected and lowest[0] >= 0
+
+async def check_ledger(db) -> bool:
+    totals = await db[LEDGER_COLLECTION].aggregate([
+        {"$group": {"_id": "$txn_id", "net": {"$sum": "$amount"}, "legs": {"$sum": 1}}},
+        {"$match": {"$or": [{"net": {"$ne": 0}}, {"legs": {"$ne": 2}}]}}
+    ]).to_list(None)
+    wallet = await db[LEDGER_COLLECTION].aggregate([
+        {"$match": {"account": user_account(USER_ID)}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]).to_list(1)
+    balance = (await db.users.find_one({"id": USER_ID}))["balance"]
+    ledger_total = OPENING_BALANCE + (wallet[0]["total"] if wallet else 0)
+    print(f"Ledger: {len(totals)} unbalanced transactions, wallet entries sum to {ledger_total:.2f} vs balance {balance:.2f}")
+    return not totals and ledger_total == balance
+
+async def main():
+    parser = argparse.ArgumentParser(description="Lost updates under concurrent balance changes")
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[BENCH_DB]
+    database.db.client = client
+    database.db.database = db
+    await db[LEDGER_COLLECTION].create_indexes(database.INDEXES[LEDGER_COLLECTION])
+
+    amounts = make_operations(args.operations, args.seed)
+    print(f"{args.operations} operations, {args.concurrency} in flight, opening balance {OPENING_BALANCE:.2f}")
+    await run("Read-modify-write", db, read_modify_write, amounts, args.concurrency)
+    ok = await run("Ledger ($inc)", db, ledger_post, amounts, args.concurrency)
+    ok = await check_ledger(db) and ok
+    print(f"Ledger transactions: {ledger_service.get_metrics()['transactions']}")
+
+    if not args.keep:
+        await client.drop_database(BENCH_DB)
+    client.close()
+    print("PASS: no lost updates, no overdraft" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
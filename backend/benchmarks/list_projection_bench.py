@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+List endpoint cost: full documents vs. registered projections
+
+Seeds a scratch database with tickets carrying long message threads and
+documents carrying inline base64 files, then times the list queries with and
+without the projection registry in utils/queries.py, reporting latency, BSON
+bytes returned and peak Python memory.
+
+Needs a reachable MongoDB (MONGO_URL), or --in-memory to seed mongomock-motor
+instead (bytes returned and memory are representative there; latency is not,
+since mongomock evaluates queries in Python; it also lacks expression projections
+in find and $substrCP, so the ticket summary runs as an aggregate $project with
+$substr there). Usage (from the backend directory):
+    python benchmarks/list_projection_bench.py --tickets 1000 --messages 50 --documents 500 --file-kb 512
+    python benchmarks/list_projection_bench.py --in-memory
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bson
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import database
+from utils.queries import find_view, projection
+
+BENCH_DB = "crib_markets_bench"
+
+async def seed(db, tickets: int, messages: int, documents: int, file_kb: int):
+    await db.tickets.drop()
+    await db.documents.drop()
+    now = datetime.utcnow()
+    thread = [
+        {"id": f"msg_{i}", "user_id": "bench", "user_name": "Bench User", "user_role": "user",
+         "message": "Lorem ipsum dolor sit amet " * 20, "attachments": [], "created_at": now}
+        for i in range(messages)
+    ]
+    await db.tickets.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": "bench", "subject": f"Ticket {i}", "description": "Benchmark ticket",
+         "category": "general", "priority": "medium", "status": "open", "created_at": now, "updated_at": now,
+         "messages": thread}
+        for i in range(tickets)
+    ])
+    file_data = base64.b64encode(os.urandom(file_kb * 1024)).decode()
+    for start in range(0, documents, 50):
+        await db.documents.insert_many([
+            {"id": str(uuid.uuid4()), "user_id": "bench", "document_type": "passport", "file_name": "passport.png",
+             "mime_type": "image/png", "file_data": file_data, "status": "pending", "uploaded_at": now}
+            for _ in range(start, min(start + 50, documents))
+        ])
+
+async def measure(label: str, query):
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = await query()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = sum(len(bson.encode(row)) for row in rows)
+    print(f"{label:<34} {elapsed * 1000:9.1f} ms | {size / 1024 / 1024:9.2f} MB returned | peak {peak / 1024 / 1024:8.2f} MB")
+
+def in_memory_projection(collection: str, view: str):
+    """The registered projection with $substrCP swapped for $substr, which mongomock implements"""
+    def swap(value):
+        if isinstance(value, dict):
+            return {("$substr" if key == "$substrCP" else key): swap(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [swap(item) for item in value]
+        return value
+    return swap(projection(collection, view))
+
+async def main():
+    parser = argparse.ArgumentParser(description="List endpoint cost with and without projections")
+    parser.add_argument("--tickets", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--file-kb", type=int, default=512)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    parser.add_argument("--in-memory", action="store_true", help="Use mongomock-motor instead of MONGO_URL")
+    args = parser.parse_args()
+
+    if args.in_memory:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    else:
+        client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[BENCH_DB]
+    database.db.database = db
+    await seed(db, args.tickets, args.messages, args.documents, args.file_kb)
+
+    print(f"{args.tickets} tickets x {args.messages} messages, {args.documents} documents x {args.file_kb} KB")
+    await measure("Tickets: full documents", lambda: db.tickets.find({}).sort("created_at", -1).to_list(None))
+    if args.in_memory:
+        await measure("Tickets: summary projection", lambda: db.tickets.aggregate([
+            {"$sort": {"created_at": -1}}, {"$project": in_memory_projection("tickets", "summary")}
+        ]).to_list(None))
+    else:
+        await measure("Tickets: summary projection", lambda: find_view("tickets", "summary", {}, sort=[("created_at", -1)]))
+    await measure("Documents: full documents", lambda: db.documents.find({"user_id": "bench"}).to_list(None))
+    await measure("Documents: summary projection", lambda: find_view("documents", "summary", {"user_id": "bench"}))
+
+    if not args.keep:
+        await client.drop_database(BENCH_DB)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
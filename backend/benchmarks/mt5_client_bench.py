@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+MT5 bridge client microbenchmark
+
+Compares calls per second of a new httpx.AsyncClient per call (the old
+behaviour) against the shared, pooled client owned by MT5Service, using a
+local stub MT5 bridge server.
+
+Usage (from the backend directory):
+    python benchmarks/mt5_client_bench.py --calls 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+ACCOUNT_INFO = json.dumps({
+    "login": 12345,
+    "balance": 1000.0,
+    "equity": 1000.0,
+    "margin": 0.0,
+    "free_margin": 1000.0,
+    "profit": 0.0,
+    "credit": 0.0,
+    "leverage": 100,
+    "name": "Bench User",
+    "server": "Demo",
+    "currency": "USD"
+}).encode()
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Minimal HTTP/1.1 keep-alive handler answering every request like the bridge"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            content_length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode().partition(":")
+                if name.lower() == "content-length":
+                    content_length = int(value.strip())
+            if content_length:
+                await reader.readexactly(content_length)
+
+            body = b'"stub-token"' if b"/Home/token" in request_line else ACCOUNT_INFO
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: keep-alive\r\n\r\n" + body
+            )
+            await writer.drain()
+    except (ConnectionResetError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def bench_per_call_client(base_url: str, calls: int, concurrency: int) -> float:
+    """Old behaviour: open a fresh AsyncClient for every bridge call"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_call(i: int):
+        async with semaphore:
+            async with httpx.AsyncClient() as client:
+                response = await client.get(f"{base_url}/Home/getUserInfo/{i}")
+                response.json()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_call(i) for i in range(calls)))
+    return calls / (time.perf_counter() - start)
+
+async def bench_pooled_service(base_url: str, calls: int, concurrency: int) -> float:
+    """New behaviour: MT5Service with one shared, pooled client"""
+    os.environ["MT5_API_BASE_URL"] = base_url
+    from services.mt5_service import MT5Service
+
+    service = MT5Service()
+    await service.start()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_call(i: int):
+        async with semaphore:
+            await service.get_account_info(i)
+
+    try:
+        await service.get_account_info(0)  # warm up login and the pool
+        start = time.perf_counter()
+        await asyncio.gather(*(one_call(i) for i in range(calls)))
+        return calls / (time.perf_counter() - start)
+    finally:
+        await service.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description="MT5 bridge client microbenchmark")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    server = await asyncio.start_server(handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    async with server:
+        per_call = await bench_per_call_client(base_url, args.calls, args.concurrency)
+        pooled = await bench_pooled_service(base_url, args.calls, args.concurrency)
+
+    print(f"Calls: {args.calls}, concurrency: {args.concurrency}")
+    print(f"New AsyncClient per call: {per_call:10.1f} calls/s")
+    print(f"Pooled MT5Service client: {pooled:10.1f} calls/s")
+    print(f"Speedup:                  {pooled / per_call:10.2f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
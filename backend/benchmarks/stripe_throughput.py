@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Stripe checkout throughput: SDK on the event loop vs. the pooled adapter
+
+Starts the fake Stripe server, then creates N checkout sessions concurrently,
+first with the synchronous SDK called inside async code (the old behaviour)
+and then through PaymentService, which uses the thread-pool adapter.
+
+Usage (from the backend directory):
+    python benchmarks/stripe_throughput.py --payments 100 --latency-ms 100
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fake_stripe import start_in_thread
+
+async def run(label: str, create, payments: int):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(create(i) for i in range(payments)))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for result in results if not result)
+    print(f"{label:<24} {elapsed * 1000:9.1f} ms | {payments / elapsed:8.1f} sessions/s | failed {failed}")
+    return elapsed
+
+async def main():
+    parser = argparse.ArgumentParser(description="Stripe checkout throughput")
+    parser.add_argument("--payments", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    fake, base_url = start_in_thread(latency=args.latency_ms / 1000)
+    os.environ["STRIPE_API_BASE"] = base_url
+    os.environ["STRIPE_SECRET_KEY"] = "sk_test_fake"
+    os.environ["STRIPE_WORKERS"] = str(args.workers)
+
+    import stripe
+    from services.payment_service import payment_service
+    from services.stripe_client import stripe_client
+
+    async def blocking_create(i: int):
+        session = stripe.checkout.Session.create(
+            mode="payment",
+            line_items=[{"price_data": {"currency": "usd", "unit_amount": 1000, "product_data": {"name": "Deposit"}}, "quantity": 1}],
+            success_url="http://localhost/success",
+            cancel_url="http://localhost/cancel"
+        )
+        return session.id
+
+    async def adapter_create(i: int):
+        result = await payment_service.create_stripe_payment(10.0, "USD", f"user-{i}", idempotency_key=f"bench-{i}")
+        return result.get("session_id")
+
+    print(f"{args.payments} concurrent checkouts, {args.latency_ms:.0f} ms API latency, {args.workers} adapter workers")
+    blocking = await run("SDK on event loop", blocking_create, args.payments)
+    pooled = await run("Thread-pool adapter", adapter_create, args.payments)
+    print(f"Speedup: {blocking / pooled:.1f}x ({fake.requests} fake API requests)")
+    stripe_client.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,8 @@
 import os
+from typing import List, Dict, Any
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,4 +27,98 @@ async def close_mongo_connection():
 
 def get_database():
     """Get database instance"""
-    return db.database
\ No newline at end of file
+    return db.database
+
+# Declarative index registry: collection name -> indexes created at startup
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+    ],
+    "payments": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        # Keyset pagination sorts on (created_at, id); see utils/pagination.py
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_id"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+        IndexModel([("status", ASCENDING), ("amount", ASCENDING)], name="status_amount"),
+        IndexModel([("reference", ASCENDING)], name="reference"),
+    ],
+    "tickets": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_id"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+    ],
+    "documents": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING)], name="user_status"),
+        IndexModel([("user_id", ASCENDING), ("uploaded_at", DESCENDING), ("id", DESCENDING)], name="user_uploaded_id"),
+        IndexModel([("status", ASCENDING), ("uploaded_at", DESCENDING), ("id", DESCENDING)], name="status_uploaded_id"),
+        # Admin review queue without a status filter
+        IndexModel([("uploaded_at", DESCENDING), ("id", DESCENDING)], name="uploaded_id"),
+    ],
+    "bank_details": [
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_unique"),
+    ],
+    "ledger_entries": [
+        IndexModel([("txn_id", ASCENDING), ("account", ASCENDING)], unique=True, name="txn_account_unique"),
+        IndexModel([("account", ASCENDING), ("created_at", DESCENDING)], name="account_created"),
+    ],
+    "work_queue": [
+        # Claim order: highest priority first, then earliest due
+        IndexModel([("status", ASCENDING), ("priority", DESCENDING), ("available_at", ASCENDING)], name="status_priority_available"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="status_created_id"),
+        # Admin job listing without a status filter
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_id"),
+        # Admin listing of dead jobs awaiting reconciliation
+        IndexModel([("needs_reconciliation", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+                   name="reconcile_created_id", partialFilterExpression={"needs_reconciliation": True}),
+        IndexModel([("dedupe_key", ASCENDING)], unique=True, name="dedupe_key_unique",
+                   partialFilterExpression={"dedupe_key": {"$exists": True}}),
+        # Completed jobs are kept for a week; dead-lettered ones stay until retried or removed
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=7 * 24 * 3600, name="finished_ttl"),
+    ],
+    "stripe_events": [
+        # Stripe retries for up to three days; remember event ids for longer than that
+        IndexModel([("received_at", ASCENDING)], expireAfterSeconds=30 * 24 * 3600, name="received_ttl"),
+    ],
+    "cashflow_monthly": [
+        IndexModel([("user_id", ASCENDING), ("month", ASCENDING)], unique=True, name="user_month_unique"),
+    ],
+}
+
+async def ensure_indexes():
+    """Create every index in the registry (no-op for indexes that already exist)"""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db.database[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. duplicate data blocking a unique index; don't take the API down over it
+            print(f"Error creating indexes on {collection}: {e}")
+    print("Database indexes ensured")
+
+async def enable_slow_query_profiling(slow_ms: int = 100):
+    """Record operations slower than slow_ms in system.profile"""
+    await db.database.command("profile", 1, slowms=slow_ms)
+
+async def find_unindexed_slow_queries(slow_ms: int = 100, limit: int = 50) -> List[Dict[str, Any]]:
+    """Report profiled slow queries that scanned a whole collection (no usable index)"""
+    entries = await db.database["system.profile"].find({
+        "millis": {"$gte": slow_ms},
+        "planSummary": {"$regex": "COLLSCAN"}
+    }).sort("ts", DESCENDING).limit(limit).to_list(limit)
+
+    return [
+        {
+            "namespace": entry.get("ns"),
+            "operation": entry.get("op"),
+            "millis": entry.get("millis"),
+            "docs_examined": entry.get("docsExamined"),
+            "filter": (entry.get("command") or {}).get("filter") or (entry.get("command") or {}).get("q"),
+            "plan": entry.get("planSummary"),
+            "ts": entry.get("ts")
+        }
+        for entry in entries
+    ]
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+CRIB Markets backend maintenance commands
+
+Usage (from the backend directory):
+    python manage.py rebuild-cashflow
+    python manage.py ensure-indexes
+    python manage.py check-indexes [--slow-ms 100] [--enable-profiling]
+    python manage.py migrate-documents [--batch-size 100]
+    python manage.py generate-previews [--all]
+    python manage.py reconcile-stats
+    python manage.py check-ledger [--open-balances]
+"""
+
+import argparse
+import asyncio
+import base64
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import connect_to_mongo, close_mongo_connection, get_database, ensure_indexes, enable_slow_query_profiling, find_unindexed_slow_queries
+from services.cashflow_service import rebuild_cashflow_rollups
+from services.blob_store import blob_store, iter_bytes
+from services.preview_service import preview_service
+from services.stats_service import reconcile_counters
+from services.ledger_service import ledger_service
+
+async def rebuild_cashflow(args):
+    count = await rebuild_cashflow_rollups()
+    print(f"Rebuilt {count} cashflow rollup documents")
+
+async def create_indexes(args):
+    await ensure_indexes()
+
+async def check_indexes(args):
+    if args.enable_profiling:
+        await enable_slow_query_profiling(args.slow_ms)
+        print(f"Slow query profiling enabled (>= {args.slow_ms} ms); run again later for a report")
+        return
+
+    queries = await find_unindexed_slow_queries(args.slow_ms)
+    if not queries:
+        print(f"No collection scans slower than {args.slow_ms} ms found in system.profile")
+        return
+    for query in queries:
+        print(f"{query['namespace']} {query['operation']} {query['millis']} ms, "
+              f"{query['docs_examined']} docs examined, filter={query['filter']}")
+
+async def migrate_documents(args):
+    db = get_database()
+    migrated = deduplicated = 0
+    cursor = db.documents.find(
+        {"file_data": {"$type": "string"}, "blob_id": {"$exists": False}},
+        {"_id": 1, "file_data": 1}
+    ).batch_size(args.batch_size)
+    async for document in cursor:
+        blob = await blob_store.put(iter_bytes(base64.b64decode(document["file_data"])), max_size=float("inf"))
+        await db.documents.update_one(
+            {"_id": document["_id"]},
+            {"$set": {"blob_id": blob["blob_id"], "sha256": blob["sha256"], "size": blob["size"]},
+             "$unset": {"file_data": ""}}
+        )
+        migrated += 1
+        deduplicated += blob["deduplicated"]
+    print(f"Moved {migrated} documents to the blob store ({deduplicated} duplicates stored once)")
+
+async def generate_previews(args):
+    db = get_database()
+    query = {"blob_id": {"$exists": True}}
+    if not args.all:
+        query["preview_status"] = {"$ne": "ready"}
+    results = {}
+    cursor = db.documents.find(query, {"_id": 0, "id": 1, "blob_id": 1, "mime_type": 1, "size": 1})
+    try:
+        async for document in cursor:
+            result = await preview_service.generate(document)
+            results[result] = results.get(result, 0) + 1
+    finally:
+        await preview_service.shutdown()
+    print(f"Preview generation: {results or 'nothing to do'}")
+
+async def reconcile_stats(args):
+    counters = await reconcile_counters()
+    for scope, values in counters.items():
+        print(f"{scope}: {values['total']} total, " + ", ".join(
+            f"{field}={values[field]}" for field in values if field not in ("total", "reconciled_at", "updated_at")
+        ))
+
+async def check_ledger(args):
+    if args.open_balances:
+        opened = await ledger_service.record_opening_balances()
+        print(f"Recorded opening ledger entries for {opened} users")
+        return
+
+    drift = await ledger_service.find_drift()
+    if not drift:
+        print("Every user balance matches its ledger entries")
+        return
+    for row in drift:
+        print(f"user {row['user_id']}: balance {row['balance']}, ledger {row['ledger']}")
+    print(f"{len(drift)} balances differ from the ledger (run with --open-balances once after upgrading)")
+
+COMMANDS = {
+    "rebuild-cashflow": (rebuild_cashflow, "Recompute the monthly cashflow rollups from payments"),
+    "ensure-indexes": (create_indexes, "Create every index in the registry"),
+    "check-indexes": (check_indexes, "Report slow queries that ran without an index"),
+    "migrate-documents": (migrate_documents, "Move inline base64 document files into the blob store"),
+    "generate-previews": (generate_previews, "Render missing WebP previews for stored documents"),
+    "reconcile-stats": (reconcile_stats, "Recount the stats_counters documents from their collections"),
+    "check-ledger": (check_ledger, "Compare user balances with the sum of their ledger entries"),
+}
+
+async def run(args):
+    await connect_to_mongo()
+    try:
+        await COMMANDS[args.command][0](args)
+    finally:
+        await close_mongo_connection()
+
+def main():
+    parser = argparse.ArgumentParser(description="CRIB Markets backend maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        command_parser = subparsers.add_parser(name, help=help_text)
+        if name == "check-indexes":
+            command_parser.add_argument("--slow-ms", type=int, default=100)
+            command_parser.add_argument("--enable-profiling", action="store_true")
+        if name == "migrate-documents":
+            command_parser.add_argument("--batch-size", type=int, default=100)
+        if name == "generate-previews":
+            command_parser.add_argument("--all", action="store_true", help="Regenerate existing previews too")
+        if name == "check-ledger":
+            command_parser.add_argument("--open-balances", action="store_true", help="Record pre-ledger balances as opening entries")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
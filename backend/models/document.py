@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 import uuid
 
@@ -15,10 +15,13 @@ class DocumentResponse(BaseModel):
     document_type: str
     file_name: str
     mime_type: str
+    size: Optional[int] = None
     status: str = "pending"
     uploaded_at: datetime
     reviewed_at: Optional[datetime] = None
     reviewer_notes: Optional[str] = None
+    preview_status: Optional[str] = None
+    previews: Dict[str, str] = {}
 
 class DocumentInDB(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -26,7 +29,13 @@ class DocumentInDB(BaseModel):
     document_type: str
     file_name: str
     mime_type: str
-    file_data: str
+    # Legacy documents carry the base64 file inline; new ones reference the blob store
+    file_data: Optional[str] = None
+    blob_id: Optional[str] = None
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+    preview_status: Optional[str] = None
+    previews: Optional[Dict[str, Dict[str, Any]]] = None
     status: str = "pending"
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
     reviewed_at: Optional[datetime] = None
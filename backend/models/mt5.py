@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -89,4 +89,8 @@ class MT5AccountCreate(BaseModel):
     leverage: int = 100
     groupName: str = "demo"
     platform: int = 5
-    server: str = "Demo"
\ No newline at end of file
+    server: str = "Demo"
+
+class MT5SnapshotRequest(BaseModel):
+    logins: Optional[List[int]] = Field(default=None, description="MT5 logins to snapshot; all linked accounts if omitted")
+    concurrency: Optional[int] = Field(default=None, gt=0, le=100)
\ No newline at end of file
@@ -24,6 +24,21 @@ class TicketResponse(BaseModel):
     assigned_to: Optional[str] = None
     messages: List[dict] = []
 
+class TicketSummary(BaseModel):
+    id: str
+    user_id: str
+    subject: str
+    description: str
+    category: str
+    priority: str
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    closed_at: Optional[datetime] = None
+    assigned_to: Optional[str] = None
+    message_count: int = 0
+    last_message: Optional[dict] = None
+
 class TicketMessage(BaseModel):
     message: str = Field(..., min_length=1)
     attachments: Optional[List[str]] = None
@@ -53,4 +53,9 @@ class UserInDB(BaseModel):
     is_active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
     mt5_accounts: List[dict] = []
-    documents: List[dict] = []
\ No newline at end of file
+    documents: List[dict] = []
+
+class TokenPrincipal(BaseModel):
+    id: str
+    role: str = "user"
+    is_active: bool = True
\ No newline at end of file
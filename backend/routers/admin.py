@@ -1,66 +1,37 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Response
+from fastapi.responses import StreamingResponse
 from database import get_database
 from models.user import UserInDB, UserResponse
-from utils.auth import get_admin_user
+from models.mt5 import MT5SnapshotRequest
+from models.document import DocumentResponse
+from services.mt5_service import mt5_service
+from services.auth_service import password_hasher
+from services.stripe_client import stripe_client
+from services.preview_service import preview_service, preview_urls
+from services.dashboard_service import dashboard_service
+from services.stats_service import record_transition, stats_reconciler
+from services.ledger_service import ledger_service, AccountNotFoundError
+from services.work_queue import work_queue
+from services.cashflow_service import set_payment_status, get_monthly_rollups, GLOBAL_SCOPE
+from utils.auth import get_admin_user, invalidate_user
+from utils.pagination import PageParams, page_params, find_page
+from utils.queries import projection, view_fields
+from utils.export import export_response
+from pymongo import ReturnDocument
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional, Literal
+import json
 
 router = APIRouter()
 
 @router.get("/dashboard")
-async def get_admin_dashboard(admin_user: UserInDB = Depends(get_admin_user)):
+async def get_admin_dashboard(
+    refresh: bool = Query(False, description="Bypass the cached snapshot"),
+    admin_user: UserInDB = Depends(get_admin_user)
+):
     """Get admin dashboard statistics"""
     try:
-        db = get_database()
-        
-        # Get user statistics
-        total_users = await db.users.count_documents({})
-        active_users = await db.users.count_documents({"is_active": True})
-        kyc_pending = await db.users.count_documents({"kyc_status": "pending"})
-        kyc_approved = await db.users.count_documents({"kyc_status": "approved"})
-        
-        # Get payment statistics
-        total_deposits = await db.payments.aggregate([
-            {"$match": {"amount": {"$gt": 0}, "status": "completed"}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]).to_list(1)
-        
-        total_withdrawals = await db.payments.aggregate([
-            {"$match": {"amount": {"$lt": 0}, "status": "completed"}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]).to_list(1)
-        
-        # Get ticket statistics
-        open_tickets = await db.tickets.count_documents({"status": "open"})
-        closed_tickets = await db.tickets.count_documents({"status": "closed"})
-        
-        # Get document statistics
-        pending_documents = await db.documents.count_documents({"status": "pending"})
-        approved_documents = await db.documents.count_documents({"status": "approved"})
-        
-        return {
-            "users": {
-                "total": total_users,
-                "active": active_users,
-                "kyc_pending": kyc_pending,
-                "kyc_approved": kyc_approved
-            },
-            "payments": {
-                "total_deposits": total_deposits[0]["total"] if total_deposits else 0,
-                "total_withdrawals": abs(total_withdrawals[0]["total"]) if total_withdrawals else 0,
-                "net_flow": (total_deposits[0]["total"] if total_deposits else 0) + (total_withdrawals[0]["total"] if total_withdrawals else 0)
-            },
-            "tickets": {
-                "open": open_tickets,
-                "closed": closed_tickets,
-                "total": open_tickets + closed_tickets
-            },
-            "documents": {
-                "pending": pending_documents,
-                "approved": approved_documents,
-                "total": pending_documents + approved_documents
-            }
-        }
+        return await dashboard_service.get_snapshot(refresh)
         
     except Exception as e:
         raise HTTPException(
@@ -68,12 +39,28 @@ async def get_admin_dashboard(admin_user: UserInDB = Depends(get_admin_user)):
             detail=f"Error fetching admin dashboard: {str(e)}"
         )
 
+@router.get("/metrics")
+async def get_admin_metrics(admin_user: UserInDB = Depends(get_admin_user)):
+    """Get in-process worker metrics (admin only)"""
+    return {
+        "password_hashing": password_hasher.get_metrics(),
+        "stripe": stripe_client.get_metrics(),
+        "previews": preview_service.get_metrics(),
+        "dashboard": dashboard_service.get_metrics(),
+        "stats_reconciler": stats_reconciler.get_metrics(),
+        "ledger": ledger_service.get_metrics(),
+        "work_queue": work_queue.get_metrics()
+    }
+
 @router.get("/users", response_model=List[UserResponse])
-async def get_all_users(admin_user: UserInDB = Depends(get_admin_user)):
+async def get_all_users(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    admin_user: UserInDB = Depends(get_admin_user)
+):
     """Get all users (admin only)"""
     try:
-        db = get_database()
-        users = await db.users.find({}).to_list(1000)
+        users = await find_page("users", "summary", {}, page, response)
         
         return [
             UserResponse(
@@ -149,10 +136,16 @@ async def update_user_kyc_status(
         db = get_database()
         
         # Update user KYC status
-        await db.users.update_one(
+        new_status = kyc_data.get("status", "pending")
+        previous = await db.users.find_one_and_update(
             {"id": user_id},
-            {"$set": {"kyc_status": kyc_data.get("status", "pending")}}
+            {"$set": {"kyc_status": new_status}},
+            projection={"kyc_status": 1},
+            return_document=ReturnDocument.BEFORE
         )
+        if previous:
+            await record_transition("users", "kyc_status", previous.get("kyc_status"), new_status)
+        invalidate_user(user_id)
         
         return {"message": "KYC status updated successfully"}
         
@@ -171,20 +164,22 @@ async def activate_user(
     try:
         db = get_database()
         
-        # Get current user status
-        user = await db.users.find_one({"id": user_id})
+        # Toggle activation status atomically, keeping the previous value for the counters
+        user = await db.users.find_one_and_update(
+            {"id": user_id},
+            [{"$set": {"is_active": {"$not": [{"$ifNull": ["$is_active", True]}]}}}],
+            projection={"is_active": 1},
+            return_document=ReturnDocument.BEFORE
+        )
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        # Toggle activation status
         new_status = not user.get("is_active", True)
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"is_active": new_status}}
-        )
+        await record_transition("users", "is_active", user.get("is_active"), new_status)
+        invalidate_user(user_id)
         
         return {"message": f"User {'activated' if new_status else 'deactivated'} successfully"}
         
@@ -202,16 +197,21 @@ async def update_user_balance(
 ):
     """Update user balance (admin only)"""
     try:
-        db = get_database()
-        
-        # Update user balance
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"balance": balance_data.get("balance", 0)}}
+        # Post the difference as a ledger adjustment rather than overwriting the balance
+        result = await ledger_service.set_balance(
+            user_id,
+            balance_data.get("balance", 0),
+            reference=f"admin:{admin_user.id}"
         )
+        invalidate_user(user_id)
         
-        return {"message": "Balance updated successfully"}
+        return {"message": "Balance updated successfully", "new_balance": result["balance"]}
         
+    except AccountNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -219,11 +219,14 @@ async def update_user_balance(
         )
 
 @router.get("/payments/history")
-async def get_all_payments(admin_user: UserInDB = Depends(get_admin_user)):
+async def get_all_payments(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    admin_user: UserInDB = Depends(get_admin_user)
+):
     """Get all payments (admin only)"""
     try:
-        db = get_database()
-        payments = await db.payments.find({}).sort("created_at", -1).to_list(1000)
+        payments = await find_page("payments", "summary", {}, page, response)
         
         return [
             {
@@ -246,6 +249,41 @@ async def get_all_payments(admin_user: UserInDB = Depends(get_admin_user)):
             detail=f"Error fetching payments: {str(e)}"
         )
 
+@router.get("/export/payments")
+async def export_payments(
+    export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    gzip: bool = False,
+    payment_status: Optional[str] = Query(None, alias="status"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """Stream every matching payment as CSV or NDJSON (admin only)"""
+    query = {}
+    if payment_status:
+        query["status"] = payment_status
+    if since or until:
+        query["created_at"] = {**({"$gte": since} if since else {}), **({"$lt": until} if until else {})}
+    cursor = get_database().payments.find(query, projection("payments", "export")).sort("created_at", 1)
+    return export_response(cursor, view_fields("payments", "export"), export_format, "payments", gzip)
+
+@router.get("/export/users")
+async def export_users(
+    export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    gzip: bool = False,
+    role: Optional[str] = None,
+    kyc_status: Optional[str] = None,
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """Stream every matching user as CSV or NDJSON (admin only)"""
+    query = {}
+    if role:
+        query["role"] = role
+    if kyc_status:
+        query["kyc_status"] = kyc_status
+    cursor = get_database().users.find(query, projection("users", "export")).sort("created_at", 1)
+    return export_response(cursor, view_fields("users", "export"), export_format, "users", gzip)
+
 @router.put("/payments/{payment_id}/status")
 async def update_payment_status(
     payment_id: str,
@@ -254,16 +292,8 @@ async def update_payment_status(
 ):
     """Update payment status (admin only)"""
     try:
-        db = get_database()
-        
-        # Update payment status
-        await db.payments.update_one(
-            {"id": payment_id},
-            {"$set": {
-                "status": status_data.get("status", "pending"),
-                "updated_at": datetime.utcnow()
-            }}
-        )
+        # Update payment status (keeps the monthly cashflow rollups in step)
+        await set_payment_status({"id": payment_id}, status_data.get("status", "pending"))
         
         return {"message": "Payment status updated successfully"}
         
@@ -273,6 +303,122 @@ async def update_payment_status(
             detail=f"Error updating payment status: {str(e)}"
         )
 
+@router.get("/documents", response_model=List[DocumentResponse])
+async def get_documents_for_review(
+    response: Response,
+    document_status: Optional[str] = Query("pending", alias="status"),
+    page: PageParams = Depends(page_params),
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """List documents for review with preview links (admin only)"""
+    try:
+        query = {"status": document_status} if document_status else {}
+        documents = await find_page("documents", "summary", query, page, response, sort_field="uploaded_at")
+        
+        return [
+            DocumentResponse(
+                id=doc["id"],
+                user_id=doc["user_id"],
+                document_type=doc["document_type"],
+                file_name=doc["file_name"],
+                mime_type=doc["mime_type"],
+                size=doc.get("size"),
+                status=doc["status"],
+                uploaded_at=doc["uploaded_at"],
+                reviewed_at=doc.get("reviewed_at"),
+                reviewer_notes=doc.get("reviewer_notes"),
+                preview_status=doc.get("preview_status"),
+                previews=preview_urls(doc)
+            )
+            for doc in documents
+        ]
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching documents: {str(e)}"
+        )
+
+@router.get("/queue")
+async def get_queue_jobs(
+    response: Response,
+    job_status: Optional[str] = Query("dead", alias="status"),
+    needs_reconciliation: bool = Query(False),
+    page: PageParams = Depends(page_params),
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """List work queue jobs, dead-lettered ones by default (admin only)"""
+    try:
+        query = {"status": job_status} if job_status else {}
+        if needs_reconciliation:
+            query["needs_reconciliation"] = True
+        jobs = await find_page("work_queue", "summary", query, page, response)
+        
+        return {"counts": await work_queue.get_counts(), "jobs": jobs}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching queue jobs: {str(e)}"
+        )
+
+@router.post("/queue/{job_id}/retry")
+async def retry_queue_job(
+    job_id: str,
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """Re-queue a dead-lettered job (admin only)"""
+    try:
+        if not await work_queue.retry_dead(job_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Dead-lettered job not found"
+            )
+        
+        return {"message": "Job re-queued"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrying job: {str(e)}"
+        )
+
+@router.post("/queue/{job_id}/reconcile")
+async def reconcile_queue_job(
+    job_id: str,
+    resolution: dict,
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """Resolve a dead-lettered job with an unknown outcome (admin only)
+
+    Send {"applied": false} once the job is known not to have taken effect, so its side effects
+    (e.g. the wallet movement of an MT5 balance operation) are reversed; {"applied": true} keeps them.
+    """
+    try:
+        if not isinstance(resolution.get("applied"), bool):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="applied (true or false) is required"
+            )
+        
+        if not await work_queue.reconcile(job_id, resolution["applied"]):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Job awaiting reconciliation not found"
+            )
+        
+        return {"message": "Job reconciled"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error reconciling job: {str(e)}"
+        )
+
 @router.get("/analytics/monthly")
 async def get_monthly_analytics(admin_user: UserInDB = Depends(get_admin_user)):
     """Get monthly analytics (admin only)"""
@@ -295,22 +441,16 @@ async def get_monthly_analytics(admin_user: UserInDB = Depends(get_admin_user)):
             {"$sort": {"_id.year": 1, "_id.month": 1}}
         ]).to_list(12)
         
-        # Get monthly payment volumes
-        monthly_payments = await db.payments.aggregate([
-            {"$match": {
-                "created_at": {"$gte": start_date, "$lte": end_date},
-                "status": "completed"
-            }},
-            {"$group": {
-                "_id": {
-                    "year": {"$year": "$created_at"},
-                    "month": {"$month": "$created_at"}
-                },
-                "total_amount": {"$sum": "$amount"},
-                "count": {"$sum": 1}
-            }},
-            {"$sort": {"_id.year": 1, "_id.month": 1}}
-        ]).to_list(12)
+        # Get monthly payment volumes from the global cashflow rollups
+        rollups = await get_monthly_rollups(GLOBAL_SCOPE, start_date)
+        monthly_payments = [
+            {
+                "_id": {"year": rollup["month"].year, "month": rollup["month"].month},
+                "total_amount": rollup["net"],
+                "count": rollup["count"]
+            }
+            for rollup in rollups[-12:]
+        ]
         
         return {
             "monthly_users": monthly_users,
@@ -321,4 +461,27 @@ async def get_monthly_analytics(admin_user: UserInDB = Depends(get_admin_user)):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fetching analytics: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/mt5/snapshot")
+async def get_mt5_snapshot(
+    snapshot_request: MT5SnapshotRequest,
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """Stream MT5 account snapshots as NDJSON, one line per login as it completes (admin only)"""
+    try:
+        logins = snapshot_request.logins
+        if not logins:
+            db = get_database()
+            logins = [login for login in await db.users.distinct("mt5_accounts.login") if login]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching MT5 logins: {str(e)}"
+        )
+
+    async def stream_snapshots():
+        async for snapshot in mt5_service.iter_account_snapshots(logins, snapshot_request.concurrency):
+            yield json.dumps(snapshot, default=str) + "\n"
+
+    return StreamingResponse(stream_snapshots(), media_type="application/x-ndjson")
\ No newline at end of file
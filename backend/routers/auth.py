@@ -3,7 +3,8 @@ from fastapi.security import HTTPBearer
 from database import get_database
 from models.user import UserCreate, UserLogin, UserResponse, UserInDB
 from services.auth_service import auth_service
-from utils.auth import get_current_active_user
+from services.stats_service import record_created
+from utils.auth import get_current_active_user, invalidate_user
 from datetime import timedelta
 
 router = APIRouter()
@@ -25,7 +26,7 @@ async def register(user_data: UserCreate):
     user_in_db = UserInDB(
         name=user_data.name,
         email=user_data.email,
-        hashed_password=auth_service.get_password_hash(user_data.password),
+        hashed_password=await auth_service.get_password_hash_async(user_data.password),
         phone=user_data.phone,
         country=user_data.country,
         city=user_data.city,
@@ -34,10 +35,11 @@ async def register(user_data: UserCreate):
     
     # Save to database
     await db.users.insert_one(user_in_db.dict())
+    await record_created("users", user_in_db.dict())
     
     # Create access token
     access_token = auth_service.create_access_token(
-        data={"sub": user_in_db.id}
+        data={"sub": user_in_db.id, "role": user_in_db.role, "is_active": user_in_db.is_active}
     )
     
     # Return user data without password
@@ -78,16 +80,25 @@ async def login(user_credentials: UserLogin):
     
     user = UserInDB(**user_doc)
     
-    # Authenticate user
-    if not auth_service.authenticate_user(user, user_credentials.password):
+    # Authenticate user (bcrypt runs on the hashing pool, not the event loop)
+    authenticated, new_hash = await auth_service.authenticate_user_async(user, user_credentials.password)
+    if not authenticated:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
+    # Transparently rehash when the configured bcrypt cost changed
+    if new_hash:
+        await db.users.update_one(
+            {"id": user.id},
+            {"$set": {"hashed_password": new_hash}}
+        )
+        invalidate_user(user.id)
+    
     # Create access token
     access_token = auth_service.create_access_token(
-        data={"sub": user.id}
+        data={"sub": user.id, "role": user.role, "is_active": user.is_active}
     )
     
     # Return user data without password
@@ -1,93 +1,127 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 from database import get_database
-from models.user import UserInDB
+from models.user import UserInDB, TokenPrincipal
 from services.mt5_service import mt5_service
-from utils.auth import get_current_active_user
+from services.equity_collector import EQUITY_COLLECTION
+from services.cashflow_service import get_monthly_rollups
+from utils.auth import get_current_active_user, get_current_active_principal
 from utils.helpers import generate_demo_chart_data, get_date_range
 from datetime import datetime, timedelta
+from typing import Dict, List
 import random
 
 router = APIRouter()
 
+# Supported equity chart resolutions and their label formats
+EQUITY_RESOLUTIONS = {
+    "hour": "%m/%d %H:00",
+    "day": "%m/%d",
+    "week": "%m/%d"
+}
+
+# Bucket start per resolution; built from date parts rather than $dateTrunc (MongoDB 5.0+)
+# so the chart also works on the plain collection the collector falls back to on older servers
+_DAY_START = {"$dateFromParts": {"year": {"$year": "$ts"}, "month": {"$month": "$ts"}, "day": {"$dayOfMonth": "$ts"}}}
+EQUITY_BUCKETS = {
+    "hour": {"$dateFromParts": {
+        "year": {"$year": "$ts"}, "month": {"$month": "$ts"}, "day": {"$dayOfMonth": "$ts"}, "hour": {"$hour": "$ts"}
+    }},
+    "day": _DAY_START,
+    # Monday of the week: $dayOfWeek is 1 (Sunday) .. 7, so (dayOfWeek + 5) % 7 days since Monday
+    "week": {"$subtract": [
+        _DAY_START,
+        {"$multiply": [{"$mod": [{"$add": [{"$dayOfWeek": "$ts"}, 5]}, 7]}, 24 * 3600 * 1000]}
+    ]}
+}
+
+def flat_balance_series(balance: float, days: int) -> Dict[str, List]:
+    """Daily series at the wallet balance, for users without an MT5 account to sample"""
+    end_date = datetime.utcnow()
+    labels = [(end_date - timedelta(days=i)).strftime("%m/%d") for i in range(days, 0, -1)]
+    return {
+        "labels": labels,
+        "equity_data": [round(balance, 2)] * days,
+        "balance_data": [round(balance, 2)] * days
+    }
+
 @router.get("/equity-data")
-async def get_equity_data(current_user: UserInDB = Depends(get_current_active_user)):
-    """Get equity chart data"""
+async def get_equity_data(
+    days: int = Query(30, ge=1, le=365),
+    resolution: str = Query("day", pattern="^(hour|day|week)$"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Get equity chart data from recorded equity snapshots"""
     try:
-        # Generate sample equity data for the last 30 days
-        days = 30
-        end_date = datetime.now()
-        dates = []
-        equity_data = []
-        balance_data = []
-        
-        base_balance = current_user.balance
-        current_equity = base_balance
-        
-        for i in range(days, 0, -1):
-            date = end_date - timedelta(days=i)
-            dates.append(date.strftime("%m/%d"))
-            
-            # Generate realistic equity fluctuation
-            daily_change = random.uniform(-0.02, 0.03)  # -2% to +3% daily change
-            current_equity = max(0, current_equity * (1 + daily_change))
-            
-            equity_data.append(round(current_equity, 2))
-            balance_data.append(round(base_balance, 2))
-        
+        if not current_user.mt5_accounts:
+            return flat_balance_series(current_user.balance, days)
+
+        db = get_database()
+        login_id = current_user.mt5_accounts[0].get("login", 12345)
+        end_date = datetime.utcnow()
+        start_date = end_date - timedelta(days=days)
+
+        # Range query, then keep the last sample in each resolution bucket
+        buckets = await db[EQUITY_COLLECTION].aggregate([
+            {"$match": {"meta.login": login_id, "ts": {"$gte": start_date, "$lte": end_date}}},
+            {"$sort": {"ts": 1}},
+            {"$group": {
+                "_id": EQUITY_BUCKETS[resolution],
+                "equity": {"$last": "$equity"},
+                "balance": {"$last": "$balance"}
+            }},
+            {"$sort": {"_id": 1}}
+        ]).to_list(None)
+
+        label_format = EQUITY_RESOLUTIONS[resolution]
         return {
-            "labels": dates,
-            "equity_data": equity_data,
-            "balance_data": balance_data
+            "labels": [bucket["_id"].strftime(label_format) for bucket in buckets],
+            "equity_data": [round(bucket["equity"], 2) for bucket in buckets],
+            "balance_data": [round(bucket["balance"], 2) for bucket in buckets]
         }
         
     except Exception as e:
-        # Return demo data on error
-        return {
-            "labels": ["01/01", "01/02", "01/03", "01/04", "01/05"],
-            "equity_data": [1000, 1050, 1020, 1080, 1100],
-            "balance_data": [1000, 1000, 1000, 1000, 1000]
-        }
+        print(f"Error fetching equity data: {e}")
+        return {"labels": [], "equity_data": [], "balance_data": []}
+
+def get_last_month_starts(months: int = 12) -> List[datetime]:
+    """First day of each of the last N calendar months, oldest first, ending with the current month"""
+    now = datetime.utcnow()
+    month_index = now.year * 12 + now.month - 1
+    return [
+        datetime((month_index - offset) // 12, (month_index - offset) % 12 + 1, 1)
+        for offset in range(months - 1, -1, -1)
+    ]
+
+async def get_monthly_cashflow(user_id: str, months: int = 12) -> Dict[str, List]:
+    """Monthly completed deposit and withdrawal totals for a user, read from the cashflow rollups"""
+    month_starts = get_last_month_starts(months)
+    rollups = await get_monthly_rollups(user_id, month_starts[0])
+    by_month = {rollup["month"]: rollup for rollup in rollups}
+
+    labels = []
+    deposit_data = []
+    withdrawal_data = []
+    for month_start in month_starts:
+        rollup = by_month.get(month_start, {})
+        labels.append(month_start.strftime("%b %Y"))
+        deposit_data.append(rollup.get("deposits", 0))
+        withdrawal_data.append(rollup.get("withdrawals", 0))
+
+    return {
+        "labels": labels,
+        "deposit_data": deposit_data,
+        "withdrawal_data": withdrawal_data
+    }
 
 @router.get("/monthly-deposits")
-async def get_monthly_deposits(current_user: UserInDB = Depends(get_current_active_user)):
+async def get_monthly_deposits(current_user: TokenPrincipal = Depends(get_current_active_principal)):
     """Get monthly deposits chart data"""
     try:
-        db = get_database()
-        
-        # Get deposits for the last 12 months
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        
-        deposits = await db.payments.find({
-            "user_id": current_user.id,
-            "amount": {"$gt": 0},
-            "status": "completed",
-            "created_at": {"$gte": start_date, "$lte": end_date}
-        }).to_list(1000)
-        
-        # Group by month
-        monthly_data = {}
-        for deposit in deposits:
-            month_key = deposit["created_at"].strftime("%Y-%m")
-            if month_key not in monthly_data:
-                monthly_data[month_key] = 0
-            monthly_data[month_key] += deposit["amount"]
-        
-        # Generate last 12 months labels
-        labels = []
-        deposit_data = []
-        
-        for i in range(11, -1, -1):
-            date = end_date - timedelta(days=i*30)
-            month_key = date.strftime("%Y-%m")
-            month_label = date.strftime("%b %Y")
-            
-            labels.append(month_label)
-            deposit_data.append(monthly_data.get(month_key, 0))
+        cashflow = await get_monthly_cashflow(current_user.id)
         
         return {
-            "labels": labels,
-            "deposit_data": deposit_data
+            "labels": cashflow["labels"],
+            "deposit_data": cashflow["deposit_data"]
         }
         
     except Exception as e:
@@ -100,45 +134,14 @@ async def get_monthly_deposits(current_user: UserInDB = Depends(get_current_acti
         }
 
 @router.get("/monthly-withdrawals")
-async def get_monthly_withdrawals(current_user: UserInDB = Depends(get_current_active_user)):
+async def get_monthly_withdrawals(current_user: TokenPrincipal = Depends(get_current_active_principal)):
     """Get monthly withdrawals chart data"""
     try:
-        db = get_database()
-        
-        # Get withdrawals for the last 12 months
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        
-        withdrawals = await db.payments.find({
-            "user_id": current_user.id,
-            "amount": {"$lt": 0},
-            "status": "completed",
-            "created_at": {"$gte": start_date, "$lte": end_date}
-        }).to_list(1000)
-        
-        # Group by month
-        monthly_data = {}
-        for withdrawal in withdrawals:
-            month_key = withdrawal["created_at"].strftime("%Y-%m")
-            if month_key not in monthly_data:
-                monthly_data[month_key] = 0
-            monthly_data[month_key] += abs(withdrawal["amount"])
-        
-        # Generate last 12 months labels
-        labels = []
-        withdrawal_data = []
-        
-        for i in range(11, -1, -1):
-            date = end_date - timedelta(days=i*30)
-            month_key = date.strftime("%Y-%m")
-            month_label = date.strftime("%b %Y")
-            
-            labels.append(month_label)
-            withdrawal_data.append(monthly_data.get(month_key, 0))
+        cashflow = await get_monthly_cashflow(current_user.id)
         
         return {
-            "labels": labels,
-            "withdrawal_data": withdrawal_data
+            "labels": cashflow["labels"],
+            "withdrawal_data": cashflow["withdrawal_data"]
         }
         
     except Exception as e:
@@ -151,62 +154,19 @@ async def get_monthly_withdrawals(current_user: UserInDB = Depends(get_current_a
         }
 
 @router.get("/deposit-withdrawal-comparison")
-async def get_deposit_withdrawal_comparison(current_user: UserInDB = Depends(get_current_active_user)):
+async def get_deposit_withdrawal_comparison(current_user: TokenPrincipal = Depends(get_current_active_principal)):
     """Get deposit vs withdrawal comparison chart data"""
     try:
-        db = get_database()
-        
-        # Get all transactions for the last 12 months
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365)
-        
-        transactions = await db.payments.find({
-            "user_id": current_user.id,
-            "status": "completed",
-            "created_at": {"$gte": start_date, "$lte": end_date}
-        }).to_list(1000)
-        
-        # Group by month
-        monthly_deposits = {}
-        monthly_withdrawals = {}
-        
-        for transaction in transactions:
-            month_key = transaction["created_at"].strftime("%Y-%m")
-            
-            if transaction["amount"] > 0:
-                if month_key not in monthly_deposits:
-                    monthly_deposits[month_key] = 0
-                monthly_deposits[month_key] += transaction["amount"]
-            else:
-                if month_key not in monthly_withdrawals:
-                    monthly_withdrawals[month_key] = 0
-                monthly_withdrawals[month_key] += abs(transaction["amount"])
-        
-        # Generate last 12 months labels
-        labels = []
-        deposit_data = []
-        withdrawal_data = []
-        net_data = []
-        
-        for i in range(11, -1, -1):
-            date = end_date - timedelta(days=i*30)
-            month_key = date.strftime("%Y-%m")
-            month_label = date.strftime("%b %Y")
-            
-            labels.append(month_label)
-            deposits = monthly_deposits.get(month_key, 0)
-            withdrawals = monthly_withdrawals.get(month_key, 0)
-            net = deposits - withdrawals
-            
-            deposit_data.append(deposits)
-            withdrawal_data.append(withdrawals)
-            net_data.append(net)
+        cashflow = await get_monthly_cashflow(current_user.id)
         
         return {
-            "labels": labels,
-            "deposit_data": deposit_data,
-            "withdrawal_data": withdrawal_data,
-            "net_data": net_data
+            "labels": cashflow["labels"],
+            "deposit_data": cashflow["deposit_data"],
+            "withdrawal_data": cashflow["withdrawal_data"],
+            "net_data": [
+                deposits - withdrawals
+                for deposits, withdrawals in zip(cashflow["deposit_data"], cashflow["withdrawal_data"])
+            ]
         }
         
     except Exception as e:
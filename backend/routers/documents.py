@@ -1,46 +1,89 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File, Form, Header, Query
+from fastapi.responses import Response, StreamingResponse
 from database import get_database
-from models.user import UserInDB
-from models.document import DocumentUpload, DocumentResponse, DocumentInDB, BankDetailsCreate, BankDetailsResponse
-from utils.auth import get_current_active_user, get_admin_user
-from utils.helpers import save_base64_file
-from datetime import datetime
-from typing import List
+from models.user import UserInDB, TokenPrincipal
+from models.document import DocumentResponse, DocumentInDB, BankDetailsCreate, BankDetailsResponse
+from services.blob_store import blob_store, read_blob, BLOB_CHUNK_SIZE, BlobTooLargeError, BlobNotFoundError
+from services.preview_service import preview_service, preview_urls, PREVIEW_VARIANTS
+from utils.auth import get_current_active_user, get_current_active_principal, get_admin_user, invalidate_user
+from utils.helpers import parse_byte_range
+from utils.queries import projection
+from utils.pagination import PageParams, page_params, find_page
+from services.stats_service import record_created, record_transition
+from pymongo import ReturnDocument
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import List, Optional
+from urllib.parse import quote
+import base64
+import hashlib
+import os
+
+# Stored files never change, so browsers may reuse them; "private" keeps them out of shared caches
+DOCUMENT_CACHE_CONTROL = f"private, max-age={os.getenv('DOCUMENT_CACHE_MAX_AGE', '86400')}"
 
 router = APIRouter()
 
+async def _iter_upload(file: UploadFile):
+    while True:
+        chunk = await file.read(BLOB_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
-    document: DocumentUpload,
+    document_type: str = Form(..., description="Type of document: id, passport, utility_bill, bank_statement"),
+    file: UploadFile = File(...),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
-    """Upload a document"""
+    """Upload a document (multipart/form-data)"""
     try:
         db = get_database()
         
+        # Stream the file into the blob store; identical files are stored once
+        try:
+            blob = await blob_store.put(_iter_upload(file))
+        except BlobTooLargeError as e:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(e)
+            )
+        finally:
+            await file.close()
+        
         # Create document record
+        mime_type = file.content_type or "application/octet-stream"
         document_record = DocumentInDB(
             user_id=current_user.id,
-            document_type=document.document_type,
-            file_name=document.file_name,
-            mime_type=document.mime_type,
-            file_data=document.file_data,
+            document_type=document_type,
+            file_name=file.filename or "document",
+            mime_type=mime_type,
+            blob_id=blob["blob_id"],
+            sha256=blob["sha256"],
+            size=blob["size"],
+            preview_status=preview_service.initial_status(mime_type, blob["size"]),
             status="pending"
         )
         
         # Save document to database
-        await db.documents.insert_one(document_record.dict())
+        await db.documents.insert_one(document_record.dict(exclude_none=True))
+        await record_created("documents", document_record.dict())
         
         # Update user's documents list
         await db.users.update_one(
             {"id": current_user.id},
             {"$push": {"documents": {
                 "id": document_record.id,
-                "type": document.document_type,
+                "type": document_type,
                 "status": "pending",
                 "uploaded_at": document_record.uploaded_at
             }}}
         )
+        invalidate_user(current_user.id)
+        
+        # Render previews in the background so review screens can skip the original
+        preview_service.schedule(document_record.dict())
         
         return DocumentResponse(
             id=document_record.id,
@@ -48,10 +91,14 @@ async def upload_document(
             document_type=document_record.document_type,
             file_name=document_record.file_name,
             mime_type=document_record.mime_type,
+            size=document_record.size,
             status=document_record.status,
-            uploaded_at=document_record.uploaded_at
+            uploaded_at=document_record.uploaded_at,
+            preview_status=document_record.preview_status
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -59,11 +106,14 @@ async def upload_document(
         )
 
 @router.get("/list", response_model=List[DocumentResponse])
-async def list_documents(current_user: UserInDB = Depends(get_current_active_user)):
+async def list_documents(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
+):
     """List user's documents"""
     try:
-        db = get_database()
-        documents = await db.documents.find({"user_id": current_user.id}).to_list(100)
+        documents = await find_page("documents", "summary", {"user_id": current_user.id}, page, response, sort_field="uploaded_at")
         
         return [
             DocumentResponse(
@@ -72,10 +122,13 @@ async def list_documents(current_user: UserInDB = Depends(get_current_active_use
                 document_type=doc["document_type"],
                 file_name=doc["file_name"],
                 mime_type=doc["mime_type"],
+                size=doc.get("size"),
                 status=doc["status"],
                 uploaded_at=doc["uploaded_at"],
                 reviewed_at=doc.get("reviewed_at"),
-                reviewer_notes=doc.get("reviewer_notes")
+                reviewer_notes=doc.get("reviewer_notes"),
+                preview_status=doc.get("preview_status"),
+                previews=preview_urls(doc)
             )
             for doc in documents
         ]
@@ -89,35 +142,179 @@ async def list_documents(current_user: UserInDB = Depends(get_current_active_use
 @router.get("/{document_id}")
 async def get_document(
     document_id: str,
-    current_user: UserInDB = Depends(get_current_active_user)
+    include_data: bool = Query(False, description="Embed the original file as base64 (prefer download_url)"),
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
 ):
     """Get a specific document"""
     try:
-        db = get_database()
-        document = await db.documents.find_one({"id": document_id, "user_id": current_user.id})
+        fields = {"_id": 0} if include_data else {"_id": 0, "file_data": 0}
+        document = await _find_accessible_document(document_id, current_user, fields)
         
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-        
-        return {
+        response = {
             "id": document["id"],
+            "user_id": document["user_id"],
             "document_type": document["document_type"],
             "file_name": document["file_name"],
             "mime_type": document["mime_type"],
-            "file_data": document["file_data"],
+            "size": document.get("size"),
+            "download_url": f"/api/documents/{document['id']}/download",
+            "preview_status": document.get("preview_status"),
+            "previews": preview_urls(document),
             "status": document["status"],
-            "uploaded_at": document["uploaded_at"]
+            "uploaded_at": document["uploaded_at"],
+            "reviewed_at": document.get("reviewed_at"),
+            "reviewer_notes": document.get("reviewer_notes")
         }
         
+        # The original is only loaded on demand; legacy documents keep it inline as base64
+        if include_data:
+            file_data = document.get("file_data")
+            if file_data is None and document.get("blob_id"):
+                file_data = base64.b64encode(await read_blob(document["blob_id"])).decode("utf-8")
+            response["file_data"] = file_data
+        
+        return response
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error retrieving document: {str(e)}"
         )
 
+async def _iter_memory(data: bytes, start: int, end: int):
+    for offset in range(start, end + 1, BLOB_CHUNK_SIZE):
+        yield data[offset:min(offset + BLOB_CHUNK_SIZE, end + 1)]
+
+async def _find_accessible_document(document_id: str, current_user: TokenPrincipal, projection: dict) -> dict:
+    """Load a document visible to the caller (its owner or an admin), or raise 404"""
+    document_filter = {"id": document_id}
+    if current_user.role != "admin":
+        document_filter["user_id"] = current_user.id
+    document = await get_database().documents.find_one(document_filter, projection)
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    return document
+
+async def _file_response(
+    blob_id: Optional[str],
+    sha256: Optional[str],
+    mime_type: str,
+    file_name: str,
+    last_modified: datetime,
+    range_header: Optional[str],
+    if_none_match: Optional[str],
+    if_range: Optional[str],
+    legacy_data: Optional[bytes] = None
+) -> Response:
+    """Stream a stored file (or legacy in-memory bytes) with ETag, Range and cache headers"""
+    if legacy_data is not None:
+        sha256 = hashlib.sha256(legacy_data).hexdigest()
+        size = len(legacy_data)
+    else:
+        try:
+            size = await blob_store.size(blob_id)
+        except BlobNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document file not found"
+            )
+
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": DOCUMENT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True),
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(file_name)}"
+    }
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # A stale If-Range validator means the client wants the whole current file
+    byte_range = None
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1 if size else 0)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    if legacy_data is not None:
+        body = _iter_memory(legacy_data, start, end)
+    else:
+        body = blob_store.iter_range(blob_id, start, end)
+    return StreamingResponse(
+        body,
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=mime_type,
+        headers=headers
+    )
+
+@router.get("/{document_id}/download")
+async def download_document(
+    document_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
+):
+    """Stream a document's raw bytes with Range and ETag support"""
+    document = await _find_accessible_document(document_id, current_user, {"file_data": 0, "previews": 0})
+
+    legacy_data = None
+    if not document.get("blob_id"):
+        # Legacy document with the file inline as base64
+        legacy = await get_database().documents.find_one({"id": document_id}, {"file_data": 1})
+        legacy_data = base64.b64decode(legacy.get("file_data") or "")
+
+    return await _file_response(
+        document.get("blob_id"), document.get("sha256"), document["mime_type"], document["file_name"],
+        document["uploaded_at"], range_header, if_none_match, if_range, legacy_data
+    )
+
+@router.get("/{document_id}/preview")
+async def get_document_preview(
+    document_id: str,
+    variant: str = Query("preview", description="Preview variant: preview or thumbnail"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
+):
+    """Stream a downscaled WebP preview of a document"""
+    if variant not in PREVIEW_VARIANTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown preview variant: {variant}"
+        )
+    document = await _find_accessible_document(
+        document_id, current_user, {"file_name": 1, "previews": 1, "preview_status": 1, "previews_generated_at": 1}
+    )
+    preview = (document.get("previews") or {}).get(variant)
+    if not preview:
+        preview_status = document.get("preview_status")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Preview not available (status: {preview_status})" if preview_status else "Preview not available"
+        )
+
+    file_name = f"{os.path.splitext(document['file_name'])[0]}-{variant}.webp"
+    return await _file_response(
+        preview["blob_id"], preview["sha256"], preview["mime_type"], file_name,
+        document["previews_generated_at"], range_header, if_none_match, if_range
+    )
+
 @router.put("/{document_id}/review")
 async def review_document(
     document_id: str,
@@ -129,24 +326,35 @@ async def review_document(
         db = get_database()
         
         # Update document status
-        await db.documents.update_one(
+        new_status = review_data.get("status", "pending")
+        document = await db.documents.find_one_and_update(
             {"id": document_id},
             {"$set": {
-                "status": review_data.get("status", "pending"),
+                "status": new_status,
                 "reviewed_at": datetime.utcnow(),
                 "reviewer_notes": review_data.get("notes", "")
-            }}
+            }},
+            projection=projection("documents", "status"),
+            return_document=ReturnDocument.BEFORE
         )
+        if document:
+            await record_transition("documents", "status", document.get("status"), new_status)
         
         # Update user's KYC status if all documents are approved
-        document = await db.documents.find_one({"id": document_id})
-        if document and review_data.get("status") == "approved":
-            user_documents = await db.documents.find({"user_id": document["user_id"]}).to_list(100)
-            if all(doc["status"] == "approved" for doc in user_documents):
-                await db.users.update_one(
+        if document and new_status == "approved":
+            unapproved = await db.documents.count_documents(
+                {"user_id": document["user_id"], "status": {"$ne": "approved"}}, limit=1
+            )
+            if unapproved == 0:
+                user = await db.users.find_one_and_update(
                     {"id": document["user_id"]},
-                    {"$set": {"kyc_status": "approved"}}
+                    {"$set": {"kyc_status": "approved"}},
+                    projection={"kyc_status": 1},
+                    return_document=ReturnDocument.BEFORE
                 )
+                if user:
+                    await record_transition("users", "kyc_status", user.get("kyc_status"), "approved")
+                invalidate_user(document["user_id"])
         
         return {"message": "Document reviewed successfully"}
         
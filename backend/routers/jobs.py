@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any
+from models.user import TokenPrincipal
+from services.work_queue import work_queue
+from utils.auth import get_current_active_principal
+import json
+import os
+
+router = APIRouter()
+
+JOB_STREAM_HEARTBEAT_SECONDS = float(os.getenv("JOB_STREAM_HEARTBEAT_SECONDS", "15"))
+
+async def _find_visible_job(job_id: str, principal: TokenPrincipal) -> Dict[str, Any]:
+    # Other users' jobs are reported as missing rather than forbidden
+    job = await work_queue.get_job(job_id)
+    if not job or (job.get("user_id") != principal.id and principal.role != "admin"):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+@router.get("/{job_id}")
+async def get_job_status(
+    job_id: str,
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
+):
+    """Get the status (and result, once done) of a background job"""
+    try:
+        return await _find_visible_job(job_id, current_user)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching job: {str(e)}"
+        )
+
+@router.get("/{job_id}/events")
+async def stream_job_status(
+    job_id: str,
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
+):
+    """Stream a job's status changes as Server-Sent Events until it is done or dead"""
+    await _find_visible_job(job_id, current_user)
+
+    async def event_stream():
+        async for job in work_queue.watch(job_id, keepalive=JOB_STREAM_HEARTBEAT_SECONDS):
+            if job is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {job['status']}\ndata: {json.dumps(job, default=str)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,14 +1,32 @@
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from database import get_database
 from models.user import UserInDB
 from models.mt5 import MT5LoginRequest, MT5AccountInfo, MT5Position, MT5Order, MT5TradeRequest, MT5HistoryRequest, MT5AccountCreate
 from services.mt5_service import mt5_service
-from utils.auth import get_current_active_user
+from services.mt5_stream import mt5_stream_hub
+from services.ledger_service import ledger_service, InsufficientFundsError, mt5_account
+from services.mt5_jobs import BALANCE_PRIORITY, ACCOUNT_PRIORITY
+from services.work_queue import work_queue
+from utils.auth import get_current_active_user, get_admin_user, invalidate_user
 from datetime import datetime, timedelta
+import asyncio
+import json
+import os
+
+# Seconds between SSE keep-alive comments on an idle stream
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("MT5_STREAM_HEARTBEAT_SECONDS", "15"))
 
 router = APIRouter()
 
+def ensure_bridge_available():
+    """Fail fast while the MT5 bridge circuit breaker is open"""
+    if mt5_service.breaker.is_open:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="MT5 bridge temporarily unavailable"
+        )
+
 @router.post("/connect")
 async def connect_mt5(
     login_request: MT5LoginRequest,
@@ -16,8 +34,8 @@ async def connect_mt5(
 ):
     """Connect to MT5 server"""
     try:
-        # Login to MT5 API
-        success = await mt5_service.login()
+        # Login to MT5 API (shares any login already in flight)
+        success = await mt5_service.session.refresh()
         if success:
             return {"message": "Connected to MT5 successfully", "status": "connected"}
         else:
@@ -40,6 +58,43 @@ async def disconnect_mt5(current_user: UserInDB = Depends(get_current_active_use
     except Exception as e:
         return {"message": "MT5 disconnect completed", "status": "disconnected"}
 
+@router.get("/metrics")
+async def get_mt5_metrics(admin_user: UserInDB = Depends(get_admin_user)):
+    """Get MT5 bridge client metrics (admin only)"""
+    metrics = mt5_service.get_metrics()
+    metrics["stream"] = mt5_stream_hub.get_metrics()
+    return metrics
+
+@router.get("/stream")
+async def stream_account(current_user: UserInDB = Depends(get_current_active_user)):
+    """Stream account equity and position changes as Server-Sent Events"""
+    if not current_user.mt5_accounts:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No MT5 account found"
+        )
+
+    login_id = current_user.mt5_accounts[0].get("login", 12345)
+
+    async def event_stream():
+        queue = mt5_stream_hub.subscribe(login_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            mt5_stream_hub.unsubscribe(login_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/account")
 async def get_account_info(current_user: UserInDB = Depends(get_current_active_user)):
     """Get MT5 account information"""
@@ -146,12 +201,14 @@ async def get_history(current_user: UserInDB = Depends(get_current_active_user))
     except Exception as e:
         return []
 
-@router.post("/account/create")
+@router.post("/account/create", status_code=status.HTTP_202_ACCEPTED)
 async def create_mt5_account(
     account_data: MT5AccountCreate,
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """Create new MT5 account"""
+    ensure_bridge_available()
+
     try:
         # Prepare account data for MT5 API
         mt5_account_data = {
@@ -173,31 +230,21 @@ async def create_mt5_account(
             "leverage": account_data.leverage
         }
         
-        # Create account in MT5
-        result = await mt5_service.create_account(mt5_account_data)
-        
-        if result:
-            # Update user's MT5 accounts
-            db = get_database()
-            new_account = {
-                "login": result.get("login", 12345),
+        # The bridge call runs on the work queue; poll /api/jobs/{job_id} or subscribe to its events
+        job = await work_queue.enqueue(
+            "mt5.create_account",
+            {
+                "user_id": current_user.id,
+                "account_data": mt5_account_data,
                 "server": account_data.server,
                 "group": account_data.groupName,
-                "leverage": account_data.leverage,
-                "created_at": datetime.utcnow().isoformat()
-            }
-            
-            await db.users.update_one(
-                {"id": current_user.id},
-                {"$push": {"mt5_accounts": new_account}}
-            )
-            
-            return {"message": "MT5 account created successfully", "account": new_account}
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Failed to create MT5 account"
-            )
+                "leverage": account_data.leverage
+            },
+            priority=ACCOUNT_PRIORITY,
+            user_id=current_user.id
+        )
+        
+        return {"message": "MT5 account creation queued", "job_id": job["id"], "status": job["status"]}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -210,6 +257,8 @@ async def open_trade(
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """Open a new trade"""
+    ensure_bridge_available()
+
     try:
         if not current_user.mt5_accounts:
             raise HTTPException(
@@ -238,6 +287,8 @@ async def close_trade(
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """Close a trade"""
+    ensure_bridge_available()
+
     try:
         if not current_user.mt5_accounts:
             raise HTTPException(
@@ -260,12 +311,14 @@ async def close_trade(
             detail=f"Error closing trade: {str(e)}"
         )
 
-@router.post("/balance")
+@router.post("/balance", status_code=status.HTTP_202_ACCEPTED)
 async def update_balance(
     operation: dict,
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """Update account balance"""
+    ensure_bridge_available()
+
     try:
         if not current_user.mt5_accounts:
             raise HTTPException(
@@ -274,30 +327,49 @@ async def update_balance(
             )
         
         login_id = current_user.mt5_accounts[0].get("login", 12345)
+        amount = operation.get("amount", 0)
+        description = operation.get("description", "Balance update")
         
-        success = await mt5_service.balance_operation(
-            login_id=login_id,
-            amount=operation.get("amount", 0),
-            txn_type=operation.get("txn_type", 0),
-            description=operation.get("description", "Balance update"),
-            comment=operation.get("comment", "")
-        )
-        
-        if success:
-            # Update user balance in database
-            db = get_database()
-            new_balance = current_user.balance + operation.get("amount", 0)
-            await db.users.update_one(
-                {"id": current_user.id},
-                {"$set": {"balance": new_balance}}
+        # Move the wallet balance first so a debit that would overdraw it never reaches MT5
+        try:
+            result = await ledger_service.post(
+                current_user.id,
+                amount,
+                mt5_account(login_id),
+                "mt5_balance",
+                description=description
             )
-            
-            return {"message": "Balance updated successfully", "new_balance": new_balance}
-        else:
+        except InsufficientFundsError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Failed to update balance"
+                detail="Insufficient balance"
             )
+        invalidate_user(current_user.id)
+        
+        # The MT5 side runs on the work queue. If the bridge certainly didn't apply it, the wallet
+        # movement is reversed; if the outcome is unknown, the job is flagged for an admin to reconcile
+        job = await work_queue.enqueue(
+            "mt5.balance_operation",
+            {
+                "login_id": login_id,
+                "amount": amount,
+                "txn_type": operation.get("txn_type", 0),
+                "description": description,
+                "comment": operation.get("comment", ""),
+                "ledger": {"user_id": current_user.id, "txn_id": result["txn_id"]}
+            },
+            priority=BALANCE_PRIORITY,
+            user_id=current_user.id
+        )
+        
+        return {
+            "message": "Balance update queued",
+            "new_balance": result["balance"],
+            "job_id": job["id"],
+            "status": job["status"]
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Response
 from database import get_database
-from models.user import UserInDB
+from models.user import UserInDB, TokenPrincipal
 from models.payment import PaymentCreate, PaymentResponse, PaymentInDB, WithdrawRequest
 from services.payment_service import payment_service
-from services.mt5_service import mt5_service
-from utils.auth import get_current_active_user
-from datetime import datetime
+from services.cashflow_service import set_payment_status
+from services.ledger_service import ledger_service, InsufficientFundsError, WITHDRAWALS_ACCOUNT
+from services.stripe_webhooks import accept_event
+from utils.auth import get_current_active_user, get_current_active_principal, invalidate_user
+from utils.pagination import PageParams, page_params, find_page
 
 router = APIRouter()
 
+# Stripe checkout session payment_status -> payment record status
+STRIPE_PAYMENT_STATUSES = {
+    "paid": "completed",
+    "no_payment_required": "completed",
+    "unpaid": "pending"
+}
+
 @router.post("/create", response_model=dict)
 async def create_payment(
     payment_data: PaymentCreate,
@@ -32,7 +41,8 @@ async def create_payment(
             payment_result = await payment_service.create_stripe_payment(
                 amount=payment_data.amount,
                 currency=payment_data.currency,
-                user_id=current_user.id
+                user_id=current_user.id,
+                idempotency_key=f"checkout-{payment_record.id}"
             )
             payment_record.payment_data = payment_result
             payment_record.reference = payment_result.get("session_id")
@@ -79,59 +89,35 @@ async def create_payment(
 
 @router.post("/webhook/stripe")
 async def stripe_webhook(request: dict):
-    """Handle Stripe webhooks"""
+    """Handle Stripe webhooks: record the event and acknowledge; side effects run on the work queue"""
+    # In production, you should verify the webhook signature
+    if not request.get("id"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Event id missing"
+        )
+    
     try:
-        # This is a simplified webhook handler
-        # In production, you should verify the webhook signature
-        
-        if request.get("type") == "checkout.session.completed":
-            session = request.get("data", {}).get("object", {})
-            session_id = session.get("id")
-            
-            # Find payment record
-            db = get_database()
-            payment_doc = await db.payments.find_one({"reference": session_id})
-            
-            if payment_doc:
-                # Update payment status
-                await db.payments.update_one(
-                    {"reference": session_id},
-                    {"$set": {"status": "completed", "updated_at": datetime.utcnow()}}
-                )
-                
-                # Update user balance
-                user_doc = await db.users.find_one({"id": payment_doc["user_id"]})
-                if user_doc:
-                    new_balance = user_doc["balance"] + payment_doc["amount"]
-                    await db.users.update_one(
-                        {"id": payment_doc["user_id"]},
-                        {"$set": {"balance": new_balance}}
-                    )
-                    
-                    # Update MT5 account balance
-                    if user_doc.get("mt5_accounts"):
-                        login_id = user_doc["mt5_accounts"][0].get("login")
-                        if login_id:
-                            await mt5_service.balance_operation(
-                                login_id=login_id,
-                                amount=payment_doc["amount"],
-                                txn_type=0,  # Deposit
-                                description="Stripe payment deposit",
-                                comment=f"Payment ID: {payment_doc['id']}"
-                            )
-        
-        return {"status": "success"}
+        accepted = await accept_event(request)
+        return {"status": "success" if accepted else "duplicate"}
         
     except Exception as e:
         print(f"Stripe webhook error: {e}")
-        return {"status": "error", "message": str(e)}
+        # A non-2xx response makes Stripe deliver the event again
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error recording webhook event: {str(e)}"
+        )
 
 @router.get("/history")
-async def get_payment_history(current_user: UserInDB = Depends(get_current_active_user)):
+async def get_payment_history(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
+):
     """Get payment history"""
     try:
-        db = get_database()
-        payments = await db.payments.find({"user_id": current_user.id}).sort("created_at", -1).to_list(100)
+        payments = await find_page("payments", "summary", {"user_id": current_user.id}, page, response)
         
         return [
             {
@@ -160,13 +146,6 @@ async def create_withdrawal(
 ):
     """Create withdrawal request"""
     try:
-        # Check if user has sufficient balance
-        if current_user.balance < withdraw_request.amount:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Insufficient balance"
-            )
-        
         db = get_database()
         
         # Create withdrawal record
@@ -178,25 +157,48 @@ async def create_withdrawal(
             status="pending"
         )
         
-        # Process withdrawal
-        payment_result = await payment_service.process_withdrawal(
-            amount=withdraw_request.amount,
-            method=withdraw_request.method,
-            bank_details=withdraw_request.bank_details
-        )
-        
-        withdrawal_record.payment_data = payment_result
-        withdrawal_record.reference = payment_result.get("reference")
-        
-        # Save withdrawal record
-        await db.payments.insert_one(withdrawal_record.dict())
+        # Deduct the amount first; the conditional $inc rejects it if the balance is too low
+        try:
+            await ledger_service.post(
+                current_user.id,
+                -withdraw_request.amount,
+                WITHDRAWALS_ACCOUNT,
+                "withdrawal",
+                reference=withdrawal_record.id,
+                description=f"Withdrawal via {withdraw_request.method}"
+            )
+        except InsufficientFundsError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Insufficient balance"
+            )
+        invalidate_user(current_user.id)
         
-        # Update user balance (deduct amount)
-        new_balance = current_user.balance - withdraw_request.amount
-        await db.users.update_one(
-            {"id": current_user.id},
-            {"$set": {"balance": new_balance}}
-        )
+        try:
+            # Process withdrawal
+            payment_result = await payment_service.process_withdrawal(
+                amount=withdraw_request.amount,
+                method=withdraw_request.method,
+                bank_details=withdraw_request.bank_details
+            )
+            
+            withdrawal_record.payment_data = payment_result
+            withdrawal_record.reference = payment_result.get("reference")
+            
+            # Save withdrawal record
+            await db.payments.insert_one(withdrawal_record.dict())
+        except Exception:
+            # Give the funds back with a reversing entry
+            await ledger_service.post(
+                current_user.id,
+                withdraw_request.amount,
+                WITHDRAWALS_ACCOUNT,
+                "withdrawal_reversal",
+                reference=withdrawal_record.id,
+                description="Withdrawal failed"
+            )
+            invalidate_user(current_user.id)
+            raise
         
         return {
             "withdrawal_id": withdrawal_record.id,
@@ -205,6 +207,8 @@ async def create_withdrawal(
             "message": "Withdrawal request created successfully"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -234,12 +238,14 @@ async def verify_payment(
                 payment_doc["method"]
             )
             
-            # Update payment status if changed
-            if payment_result.get("status") != payment_doc["status"]:
-                await db.payments.update_one(
-                    {"id": payment_id},
-                    {"$set": {"status": payment_result["status"], "updated_at": datetime.utcnow()}}
-                )
+            new_status = STRIPE_PAYMENT_STATUSES.get(payment_result.get("status"), payment_result.get("status"))
+            
+            # Update payment status if changed; a completed payment is never downgraded from here
+            # (that would reverse its cashflow rollups), and the filter keeps a racing webhook's completion
+            if payment_doc["status"] != "completed" and new_status != payment_doc["status"]:
+                previous = await set_payment_status({"id": payment_id, "status": {"$ne": "completed"}}, new_status)
+                if previous:
+                    payment_doc["status"] = new_status
         
         return {
             "payment_id": payment_doc["id"],
@@ -249,6 +255,8 @@ async def verify_payment(
             "reference": payment_doc.get("reference")
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, status, Response
 from database import get_database
-from models.user import UserInDB
-from models.ticket import TicketCreate, TicketResponse, TicketInDB, TicketMessage
-from utils.auth import get_current_active_user, get_admin_user
+from models.user import UserInDB, TokenPrincipal
+from models.ticket import TicketCreate, TicketResponse, TicketSummary, TicketInDB, TicketMessage
+from utils.auth import get_current_active_user, get_current_active_principal, get_admin_user
+from utils.pagination import PageParams, page_params, find_page
+from services.stats_service import record_created, record_transition
+from pymongo import ReturnDocument
 from datetime import datetime
 from typing import List
 
@@ -29,6 +32,7 @@ async def create_ticket(
         
         # Save ticket
         await db.tickets.insert_one(ticket.dict())
+        await record_created("tickets", ticket.dict())
         
         return TicketResponse(
             id=ticket.id,
@@ -49,15 +53,18 @@ async def create_ticket(
             detail=f"Error creating ticket: {str(e)}"
         )
 
-@router.get("/list", response_model=List[TicketResponse])
-async def list_tickets(current_user: UserInDB = Depends(get_current_active_user)):
+@router.get("/list", response_model=List[TicketSummary])
+async def list_tickets(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
+):
     """List user's tickets"""
     try:
-        db = get_database()
-        tickets = await db.tickets.find({"user_id": current_user.id}).sort("created_at", -1).to_list(100)
+        tickets = await find_page("tickets", "summary", {"user_id": current_user.id}, page, response)
         
         return [
-            TicketResponse(
+            TicketSummary(
                 id=ticket["id"],
                 user_id=ticket["user_id"],
                 subject=ticket["subject"],
@@ -69,7 +76,8 @@ async def list_tickets(current_user: UserInDB = Depends(get_current_active_user)
                 updated_at=ticket["updated_at"],
                 closed_at=ticket.get("closed_at"),
                 assigned_to=ticket.get("assigned_to"),
-                messages=ticket.get("messages", [])
+                message_count=ticket["message_count"],
+                last_message=ticket.get("last_message")
             )
             for ticket in tickets
         ]
@@ -83,7 +91,7 @@ async def list_tickets(current_user: UserInDB = Depends(get_current_active_user)
 @router.get("/{ticket_id}", response_model=TicketResponse)
 async def get_ticket(
     ticket_id: str,
-    current_user: UserInDB = Depends(get_current_active_user)
+    current_user: TokenPrincipal = Depends(get_current_active_principal)
 ):
     """Get a specific ticket"""
     try:
@@ -128,7 +136,7 @@ async def add_message_to_ticket(
         db = get_database()
         
         # Check if ticket exists and belongs to user
-        ticket = await db.tickets.find_one({"id": ticket_id, "user_id": current_user.id})
+        ticket = await db.tickets.find_one({"id": ticket_id, "user_id": current_user.id}, {"_id": 1})
         if not ticket:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -172,25 +180,25 @@ async def close_ticket(
     try:
         db = get_database()
         
-        # Check if ticket exists and belongs to user
-        ticket = await db.tickets.find_one({"id": ticket_id, "user_id": current_user.id})
-        if not ticket:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Ticket not found"
-            )
-        
-        # Close ticket
-        await db.tickets.update_one(
-            {"id": ticket_id},
+        # Close the ticket if it exists and belongs to user
+        ticket = await db.tickets.find_one_and_update(
+            {"id": ticket_id, "user_id": current_user.id},
             {
                 "$set": {
                     "status": "closed",
                     "closed_at": datetime.utcnow(),
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"status": 1},
+            return_document=ReturnDocument.BEFORE
         )
+        if not ticket:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Ticket not found"
+            )
+        await record_transition("tickets", "status", ticket.get("status"), "closed")
         
         return {"message": "Ticket closed successfully"}
         
@@ -200,15 +208,18 @@ async def close_ticket(
             detail=f"Error closing ticket: {str(e)}"
         )
 
-@router.get("/admin/all", response_model=List[TicketResponse])
-async def list_all_tickets(admin_user: UserInDB = Depends(get_admin_user)):
+@router.get("/admin/all", response_model=List[TicketSummary])
+async def list_all_tickets(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    admin_user: UserInDB = Depends(get_admin_user)
+):
     """List all tickets (admin only)"""
     try:
-        db = get_database()
-        tickets = await db.tickets.find({}).sort("created_at", -1).to_list(1000)
+        tickets = await find_page("tickets", "summary", {}, page, response)
         
         return [
-            TicketResponse(
+            TicketSummary(
                 id=ticket["id"],
                 user_id=ticket["user_id"],
                 subject=ticket["subject"],
@@ -220,7 +231,8 @@ async def list_all_tickets(admin_user: UserInDB = Depends(get_admin_user)):
                 updated_at=ticket["updated_at"],
                 closed_at=ticket.get("closed_at"),
                 assigned_to=ticket.get("assigned_to"),
-                messages=ticket.get("messages", [])
+                message_count=ticket["message_count"],
+                last_message=ticket.get("last_message")
             )
             for ticket in tickets
         ]
@@ -242,16 +254,21 @@ async def assign_ticket(
         db = get_database()
         
         # Update ticket
-        await db.tickets.update_one(
+        new_status = assign_data.get("status", "in_progress")
+        ticket = await db.tickets.find_one_and_update(
             {"id": ticket_id},
             {
                 "$set": {
                     "assigned_to": assign_data.get("assigned_to"),
-                    "status": assign_data.get("status", "in_progress"),
+                    "status": new_status,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"status": 1},
+            return_document=ReturnDocument.BEFORE
         )
+        if ticket:
+            await record_transition("tickets", "status", ticket.get("status"), new_status)
         
         return {"message": "Ticket assigned successfully"}
         
@@ -272,7 +289,7 @@ async def admin_reply_to_ticket(
         db = get_database()
         
         # Check if ticket exists
-        ticket = await db.tickets.find_one({"id": ticket_id})
+        ticket = await db.tickets.find_one({"id": ticket_id}, {"_id": 1})
         if not ticket:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
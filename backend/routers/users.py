@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from database import get_database
 from models.user import UserInDB, UserUpdate, UserResponse
-from utils.auth import get_current_active_user
+from services.ledger_service import ledger_service, InsufficientFundsError, ADJUSTMENTS_ACCOUNT
+from utils.auth import get_current_active_user, invalidate_user
 
 router = APIRouter()
 
@@ -51,6 +52,7 @@ async def update_user_profile(
                 {"id": current_user.id},
                 {"$set": update_data}
             )
+            invalidate_user(current_user.id)
         
         # Get updated user
         updated_user_doc = await db.users.find_one({"id": current_user.id})
@@ -89,15 +91,21 @@ async def update_user_balance(
 ):
     """Update user balance (admin function)"""
     try:
-        db = get_database()
-        new_balance = current_user.balance + amount
-        
-        await db.users.update_one(
-            {"id": current_user.id},
-            {"$set": {"balance": new_balance}}
+        result = await ledger_service.post(
+            current_user.id,
+            amount,
+            ADJUSTMENTS_ACCOUNT,
+            "adjustment",
+            description="Balance update"
         )
+        invalidate_user(current_user.id)
         
-        return {"message": "Balance updated successfully", "new_balance": new_balance}
+        return {"message": "Balance updated successfully", "new_balance": result["balance"]}
+    except InsufficientFundsError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Insufficient balance"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
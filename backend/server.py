@@ -9,17 +9,44 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import routers
-from routers import auth, mt5, payments, charts, users, documents, tickets, admin
+from routers import auth, mt5, payments, charts, users, documents, tickets, admin, jobs
 
 # Database connection
-from database import connect_to_mongo, close_mongo_connection
+from database import connect_to_mongo, close_mongo_connection, ensure_indexes, enable_slow_query_profiling
+
+# MT5 bridge client
+from services.mt5_service import mt5_service
+from services.mt5_stream import mt5_stream_hub
+from services.equity_collector import equity_collector
+from services.auth_service import password_hasher
+from services.stripe_client import stripe_client
+from services.preview_service import preview_service
+from services.stats_service import stats_reconciler
+from services.work_queue import work_queue
+from services import mt5_jobs, stripe_webhooks  # register their job handlers with the work queue
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    await ensure_indexes()
+    if os.getenv("MONGO_INDEX_CHECK", "false").lower() == "true":
+        # Profile slow queries so `python manage.py check-indexes` can report missing indexes
+        await enable_slow_query_profiling(int(os.getenv("MONGO_SLOW_QUERY_MS", "100")))
+    await mt5_service.start()
+    await equity_collector.start()
+    await stats_reconciler.start()
+    await work_queue.start()
     yield
     # Shutdown
+    await work_queue.stop()
+    await stats_reconciler.stop()
+    await equity_collector.stop()
+    await mt5_stream_hub.close()
+    await mt5_service.close()
+    password_hasher.shutdown()
+    stripe_client.shutdown()
+    await preview_service.shutdown()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -40,6 +67,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read the pagination cursor
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -51,6 +80,7 @@ app.include_router(users.router, prefix="/api/user", tags=["User Management"])
 app.include_router(documents.router, prefix="/api/documents", tags=["Document Management"])
 app.include_router(tickets.router, prefix="/api/tickets", tags=["Support Tickets"])
 app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Background Jobs"])
 
 @app.get("/")
 async def root():
@@ -1,18 +1,67 @@
 import os
+import asyncio
 import jwt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
-from typing import Optional
+from typing import Optional, Tuple, Dict, Any, Callable
 from models.user import UserInDB, UserCreate, UserLogin
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing; hashes made with a different cost are upgraded on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+class PasswordHasher:
+    """Bounded thread pool that keeps bcrypt work off the event loop"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queue_depth = 0
+
+    def _run(self, fn: Callable, args: tuple):
+        self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            self.running -= 1
+
+    async def run(self, fn: Callable, *args):
+        """Run a blocking hash function on the pool"""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.pending - self.running)
+        try:
+            return await loop.run_in_executor(self.executor, self._run, fn, args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get pool and queue-depth metrics"""
+        return {
+            "workers": self.workers,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "running": self.running,
+            "queue_depth": max(0, self.pending - self.running),
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed
+        }
+
+password_hasher = PasswordHasher(int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
 class AuthService:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -24,6 +73,16 @@ class AuthService:
         """Hash a password"""
         return pwd_context.hash(password)
 
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against its hash on the hashing pool"""
+        return await password_hasher.run(pwd_context.verify, plain_password, hashed_password)
+
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        """Hash a password on the hashing pool"""
+        return await password_hasher.run(pwd_context.hash, password)
+
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """Create JWT access token"""
@@ -55,5 +114,12 @@ class AuthService:
             return False
         return True
 
+    @staticmethod
+    async def authenticate_user_async(user: UserInDB, password: str) -> Tuple[bool, Optional[str]]:
+        """Authenticate user on the hashing pool; also returns a new hash if the cost changed"""
+        if not user:
+            return False, None
+        return await password_hasher.run(pwd_context.verify_and_update, password, user.hashed_password)
+
 # Global instance
 auth_service = AuthService()
\ No newline at end of file
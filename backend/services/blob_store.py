@@ -0,0 +1,162 @@
+import hashlib
+import os
+import uuid
+from typing import AsyncIterator, Optional, Dict, Any
+import aiofiles
+import aiofiles.os
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from database import get_database
+
+BLOB_CHUNK_SIZE = int(os.getenv("BLOB_CHUNK_SIZE", "262144"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+
+class BlobTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+    pass
+
+class BlobNotFoundError(Exception):
+    """Raised when a blob id is not in the store"""
+    pass
+
+class LocalBlobStore:
+    """Content-addressed blobs on the local filesystem, sharded by the first bytes of the sha256"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, blob_id: str) -> str:
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+
+    async def put(self, chunks: AsyncIterator[bytes], max_size: int = MAX_UPLOAD_BYTES) -> Dict[str, Any]:
+        """Stream chunks to disk while hashing; identical content is stored once"""
+        tmp_dir = os.path.join(self.root, "tmp")
+        await aiofiles.os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise BlobTooLargeError(f"Upload exceeds {max_size} bytes")
+                    digest.update(chunk)
+                    await f.write(chunk)
+
+            blob_id = digest.hexdigest()
+            path = self._path(blob_id)
+            if await aiofiles.os.path.exists(path):
+                await aiofiles.os.remove(tmp_path)
+                return {"blob_id": blob_id, "sha256": blob_id, "size": size, "deduplicated": True}
+            await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+            await aiofiles.os.replace(tmp_path, path)
+            return {"blob_id": blob_id, "sha256": blob_id, "size": size, "deduplicated": False}
+        except BaseException:
+            if await aiofiles.os.path.exists(tmp_path):
+                await aiofiles.os.remove(tmp_path)
+            raise
+
+    async def size(self, blob_id: str) -> int:
+        """Size of a stored blob in bytes"""
+        try:
+            return (await aiofiles.os.stat(self._path(blob_id))).st_size
+        except FileNotFoundError:
+            raise BlobNotFoundError(blob_id)
+
+    async def iter_range(self, blob_id: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes in [start, end] (inclusive) in BLOB_CHUNK_SIZE pieces"""
+        try:
+            f = await aiofiles.open(self._path(blob_id), "rb")
+        except FileNotFoundError:
+            raise BlobNotFoundError(blob_id)
+        try:
+            await f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await f.read(BLOB_CHUNK_SIZE if remaining is None else min(BLOB_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await f.close()
+
+class GridFSBlobStore:
+    """Content-addressed blobs in GridFS; the sha256 is used as the file name"""
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+
+    def _bucket(self) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(get_database(), bucket_name=self.bucket_name, chunk_size_bytes=BLOB_CHUNK_SIZE)
+
+    async def _find(self, blob_id: str) -> Optional[Dict[str, Any]]:
+        return await get_database()[f"{self.bucket_name}.files"].find_one({"filename": blob_id})
+
+    async def put(self, chunks: AsyncIterator[bytes], max_size: int = MAX_UPLOAD_BYTES) -> Dict[str, Any]:
+        """Stream chunks into GridFS while hashing; identical content is stored once"""
+        bucket = self._bucket()
+        # The hash is only known at the end, so upload under a temporary name and rename
+        grid_in = bucket.open_upload_stream(f"pending-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise BlobTooLargeError(f"Upload exceeds {max_size} bytes")
+                digest.update(chunk)
+                await grid_in.write(chunk)
+            await grid_in.close()
+        except BaseException:
+            await grid_in.abort()
+            raise
+
+        blob_id = digest.hexdigest()
+        if await self._find(blob_id):
+            await bucket.delete(grid_in._id)
+            return {"blob_id": blob_id, "sha256": blob_id, "size": size, "deduplicated": True}
+        await bucket.rename(grid_in._id, blob_id)
+        return {"blob_id": blob_id, "sha256": blob_id, "size": size, "deduplicated": False}
+
+    async def size(self, blob_id: str) -> int:
+        """Size of a stored blob in bytes"""
+        file_doc = await self._find(blob_id)
+        if not file_doc:
+            raise BlobNotFoundError(blob_id)
+        return file_doc["length"]
+
+    async def iter_range(self, blob_id: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes in [start, end] (inclusive) in BLOB_CHUNK_SIZE pieces"""
+        file_doc = await self._find(blob_id)
+        if not file_doc:
+            raise BlobNotFoundError(blob_id)
+        grid_out = await self._bucket().open_download_stream(file_doc["_id"])
+        grid_out.seek(start)
+        remaining = (file_doc["length"] if end is None else end + 1) - start
+        while remaining > 0:
+            chunk = await grid_out.read(min(BLOB_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+async def iter_bytes(data: bytes) -> AsyncIterator[bytes]:
+    """Adapt an in-memory payload to the chunk iterator put() expects"""
+    for i in range(0, len(data), BLOB_CHUNK_SIZE):
+        yield data[i:i + BLOB_CHUNK_SIZE]
+
+async def read_blob(blob_id: str) -> bytes:
+    """Read a whole blob into memory (small files only)"""
+    return b"".join([chunk async for chunk in blob_store.iter_range(blob_id)])
+
+def create_blob_store():
+    """Build the blob store selected by BLOB_STORE_BACKEND"""
+    backend = os.getenv("BLOB_STORE_BACKEND", "local").lower()
+    if backend == "gridfs":
+        return GridFSBlobStore(os.getenv("BLOB_GRIDFS_BUCKET", "blobs"))
+    return LocalBlobStore(os.getenv("BLOB_STORE_PATH", "uploads/blobs"))
+
+# Global instance
+blob_store = create_blob_store()
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from pymongo import ReturnDocument
+from database import get_database, ensure_indexes
+
+CASHFLOW_COLLECTION = "cashflow_monthly"
+
+# user_id of the rollup documents that aggregate every user
+GLOBAL_SCOPE = "__all__"
+
+def month_start(dt: datetime) -> datetime:
+    """First instant of the calendar month containing dt"""
+    return datetime(dt.year, dt.month, 1)
+
+async def _apply_rollup(payment: Dict[str, Any], sign: int):
+    db = get_database()
+    amount = payment["amount"]
+    increments = {
+        "deposits": amount * sign if amount > 0 else 0,
+        "withdrawals": abs(amount) * sign if amount < 0 else 0,
+        "net": amount * sign,
+        "count": sign
+    }
+    month = month_start(payment["created_at"])
+    await asyncio.gather(*(
+        db[CASHFLOW_COLLECTION].update_one(
+            {"user_id": user_id, "month": month},
+            {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        for user_id in (payment["user_id"], GLOBAL_SCOPE)
+    ))
+
+async def record_completed_payment(payment: Dict[str, Any]):
+    """Add a payment that just became completed to its user's and the global monthly rollups"""
+    await _apply_rollup(payment, 1)
+
+async def revert_completed_payment(payment: Dict[str, Any]):
+    """Remove a payment that is no longer completed from the monthly rollups"""
+    await _apply_rollup(payment, -1)
+
+async def complete_payment(payment_filter: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Atomically mark a payment completed; returns it only if this call made the transition"""
+    db = get_database()
+    payment = await db.payments.find_one_and_update(
+        {**payment_filter, "status": {"$ne": "completed"}},
+        {"$set": {"status": "completed", "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if payment:
+        await record_completed_payment(payment)
+    return payment
+
+async def set_payment_status(payment_filter: Dict[str, Any], new_status: str) -> Optional[Dict[str, Any]]:
+    """Set a payment's status and keep the rollups in step with completed transitions"""
+    db = get_database()
+    previous = await db.payments.find_one_and_update(
+        payment_filter,
+        {"$set": {"status": new_status, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous:
+        was_completed = previous["status"] == "completed"
+        if new_status == "completed" and not was_completed:
+            await record_completed_payment(previous)
+        elif was_completed and new_status != "completed":
+            await revert_completed_payment(previous)
+    return previous
+
+async def get_monthly_rollups(user_id: str, since: datetime) -> List[Dict[str, Any]]:
+    """Monthly rollup documents for a user (or GLOBAL_SCOPE) from `since`, oldest first"""
+    db = get_database()
+    return await db[CASHFLOW_COLLECTION].find(
+        {"user_id": user_id, "month": {"$gte": month_start(since)}}
+    ).sort("month", 1).to_list(None)
+
+async def rebuild_cashflow_rollups() -> int:
+    """Recompute every rollup from the payments collection (backfill / repair)"""
+    db = get_database()
+    # $merge needs the unique (user_id, month) index from the registry
+    await ensure_indexes()
+    await db[CASHFLOW_COLLECTION].delete_many({})
+
+    month_expr = {"$dateFromParts": {"year": {"$year": "$created_at"}, "month": {"$month": "$created_at"}}}
+    sums = {
+        "deposits": {"$sum": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0]}},
+        "withdrawals": {"$sum": {"$cond": [{"$lt": ["$amount", 0]}, {"$abs": "$amount"}, 0]}},
+        "net": {"$sum": "$amount"},
+        "count": {"$sum": 1}
+    }
+    merge = {"$merge": {"into": CASHFLOW_COLLECTION, "on": ["user_id", "month"], "whenMatched": "replace"}}
+    project = {
+        "_id": 0,
+        "month": "$_id.month",
+        "deposits": 1,
+        "withdrawals": 1,
+        "net": 1,
+        "count": 1,
+        "updated_at": "$$NOW"
+    }
+
+    await db.payments.aggregate([
+        {"$match": {"status": "completed"}},
+        {"$group": {"_id": {"user_id": "$user_id", "month": month_expr}, **sums}},
+        {"$project": {**project, "user_id": "$_id.user_id"}},
+        merge
+    ]).to_list(None)
+    await db.payments.aggregate([
+        {"$match": {"status": "completed"}},
+        {"$group": {"_id": {"month": month_expr}, **sums}},
+        {"$project": {**project, "user_id": {"$literal": GLOBAL_SCOPE}}},
+        merge
+    ]).to_list(None)
+
+    return await db[CASHFLOW_COLLECTION].count_documents({})
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Any
+from database import get_database
+from services.cashflow_service import CASHFLOW_COLLECTION, GLOBAL_SCOPE
+from services.stats_service import COUNTED_FIELDS, get_counters, reconcile_counters
+from utils.cache import TTLCache
+from utils.singleflight import SingleFlight
+
+SNAPSHOT_KEY = "dashboard"
+
+class DashboardService:
+    """Admin dashboard statistics, read from materialised counters and cached as one snapshot"""
+
+    def __init__(self):
+        self.ttl = float(os.getenv("ADMIN_DASHBOARD_CACHE_SECONDS", "30"))
+        self.cache = TTLCache(max_size=1)
+        self.coalescer = SingleFlight()
+        self.computations = 0
+
+    @staticmethod
+    def _user_stats(counters: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "total": counters.get("total", 0),
+            "active": counters.get("is_active", {}).get("True", 0),
+            "kyc_pending": counters.get("kyc_status", {}).get("pending", 0),
+            "kyc_approved": counters.get("kyc_status", {}).get("approved", 0)
+        }
+
+    async def _payment_stats(self) -> Dict[str, Any]:
+        # Completed-payment totals come from the global monthly rollups, one document per month
+        totals = await get_database()[CASHFLOW_COLLECTION].aggregate([
+            {"$match": {"user_id": GLOBAL_SCOPE}},
+            {"$group": {"_id": None, "deposits": {"$sum": "$deposits"}, "withdrawals": {"$sum": "$withdrawals"}}}
+        ]).to_list(1)
+        deposits = totals[0]["deposits"] if totals else 0
+        withdrawals = totals[0]["withdrawals"] if totals else 0
+        return {
+            "total_deposits": deposits,
+            "total_withdrawals": withdrawals,
+            "net_flow": deposits - withdrawals
+        }
+
+    @staticmethod
+    def _ticket_stats(counters: Dict[str, Any]) -> Dict[str, Any]:
+        by_status = counters.get("status", {})
+        return {
+            "open": by_status.get("open", 0),
+            "closed": by_status.get("closed", 0),
+            "total": by_status.get("open", 0) + by_status.get("closed", 0),
+            "by_status": by_status,
+            "by_priority": counters.get("priority", {})
+        }
+
+    @staticmethod
+    def _document_stats(counters: Dict[str, Any]) -> Dict[str, Any]:
+        by_status = counters.get("status", {})
+        return {
+            "pending": by_status.get("pending", 0),
+            "approved": by_status.get("approved", 0),
+            "total": by_status.get("pending", 0) + by_status.get("approved", 0),
+            "by_status": by_status,
+            "by_type": counters.get("document_type", {})
+        }
+
+    async def _load_counters(self) -> Dict[str, Dict[str, Any]]:
+        counters = await get_counters()
+        if len(counters) < len(COUNTED_FIELDS):
+            # First run against this database: seed the counters from a full recount
+            counters = await reconcile_counters()
+        return counters
+
+    async def _compute(self) -> Dict[str, Any]:
+        self.computations += 1
+        # Counter documents (materialised by stats_service) and payment rollups: O(1) reads
+        counters, payments = await asyncio.gather(self._load_counters(), self._payment_stats())
+        snapshot = {
+            "users": self._user_stats(counters.get("users", {})),
+            "payments": payments,
+            "tickets": self._ticket_stats(counters.get("tickets", {})),
+            "documents": self._document_stats(counters.get("documents", {})),
+            "generated_at": datetime.utcnow()
+        }
+        self.cache.set(SNAPSHOT_KEY, snapshot, self.ttl)
+        return snapshot
+
+    async def get_snapshot(self, refresh: bool = False) -> Dict[str, Any]:
+        """Cached dashboard snapshot; concurrent misses share one computation"""
+        if not refresh:
+            found, snapshot, _ = self.cache.get(SNAPSHOT_KEY)
+            if found:
+                return snapshot
+        return await self.coalescer.do(SNAPSHOT_KEY, self._compute)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get cache and computation counters"""
+        return {
+            "ttl_seconds": self.ttl,
+            "computations": self.computations,
+            "cache": self.cache.get_metrics(),
+            "coalescing": self.coalescer.get_metrics()
+        }
+
+# Global instance
+dashboard_service = DashboardService()
@@ -0,0 +1,95 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from pymongo.errors import CollectionInvalid, OperationFailure
+from database import get_database
+from services.mt5_service import mt5_service
+
+EQUITY_COLLECTION = "equity_snapshots"
+
+class EquityCollector:
+    """Periodically sample balance/equity for every linked MT5 login into a time-series collection"""
+
+    def __init__(self):
+        self.enabled = os.getenv("EQUITY_COLLECTOR_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("EQUITY_SNAPSHOT_INTERVAL", "300"))
+        self.concurrency = int(os.getenv("EQUITY_SNAPSHOT_CONCURRENCY", "20"))
+        self.batch_size = int(os.getenv("EQUITY_SNAPSHOT_BATCH_SIZE", "1000"))
+        self.samples_written = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_collection(self):
+        """Create the time-series collection, falling back to a plain indexed collection"""
+        db = get_database()
+        if EQUITY_COLLECTION in await db.list_collection_names():
+            return
+        try:
+            await db.create_collection(
+                EQUITY_COLLECTION,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"}
+            )
+        except CollectionInvalid:
+            # Created concurrently by another worker
+            return
+        except OperationFailure as e:
+            # MongoDB < 5.0 has no time-series collections
+            print(f"Time-series collection unavailable, using a regular collection: {e}")
+            await db[EQUITY_COLLECTION].create_index([("meta.login", 1), ("ts", 1)])
+
+    async def start(self):
+        """Start the background collector"""
+        if not self.enabled or self._task is not None:
+            return
+        await self.ensure_collection()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background collector"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.collect_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error collecting equity snapshots: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def collect_once(self) -> int:
+        """Sample every linked login once and bulk insert the samples"""
+        db = get_database()
+        logins = [login for login in await db.users.distinct("mt5_accounts.login") if login]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        sampled_at = datetime.utcnow()
+
+        async def sample(login_id: int) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                account = await mt5_service.get_account_info(login_id)
+            if account is None:
+                return None
+            return {
+                "ts": sampled_at,
+                "meta": {"login": login_id},
+                "balance": account.balance,
+                "equity": account.equity
+            }
+
+        samples: List[Dict[str, Any]] = [
+            doc for doc in await asyncio.gather(*(sample(login) for login in logins)) if doc
+        ]
+        for i in range(0, len(samples), self.batch_size):
+            await db[EQUITY_COLLECTION].insert_many(samples[i:i + self.batch_size], ordered=False)
+        self.samples_written += len(samples)
+        return len(samples)
+
+# Global instance
+equity_collector = EquityCollector()
@@ -0,0 +1,267 @@
+import os
+import uuid
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from database import db, get_database
+
+LEDGER_COLLECTION = "ledger_entries"
+
+# Counterparty accounts for the double entry; only user wallets are materialised (users.balance)
+STRIPE_ACCOUNT = "external:stripe"
+WITHDRAWALS_ACCOUNT = "external:withdrawals"
+ADJUSTMENTS_ACCOUNT = "system:adjustments"
+OPENING_ACCOUNT = "system:opening_balance"
+
+def user_account(user_id: str) -> str:
+    """Ledger account of a user's wallet"""
+    return f"user:{user_id}"
+
+def mt5_account(login_id: Any) -> str:
+    """Ledger account of an MT5 trading login"""
+    return f"mt5:{login_id}"
+
+class LedgerError(Exception):
+    """Base class for ledger posting failures"""
+
+class AccountNotFoundError(LedgerError):
+    """The user whose balance should move does not exist"""
+
+class InsufficientFundsError(LedgerError):
+    """The debit would take the balance below zero"""
+
+class BalanceConflictError(LedgerError):
+    """The balance changed between reading it and posting against it"""
+
+class DuplicateTransactionError(LedgerError):
+    """A transaction with this txn_id was already posted"""
+
+def _is_duplicate(error: Exception) -> bool:
+    if isinstance(error, DuplicateKeyError):
+        return True
+    # insert_many reports duplicate keys as a bulk write error
+    return isinstance(error, BulkWriteError) and all(
+        write_error.get("code") == 11000 for write_error in error.details.get("writeErrors", [])
+    )
+
+class LedgerService:
+    """Append-only double-entry ledger; user balances move only through conditional $inc"""
+
+    def __init__(self):
+        # "auto" probes the deployment; transactions need a replica set or sharded cluster
+        self.transactions = os.getenv("LEDGER_TRANSACTIONS", "auto").lower()
+        self._supports_transactions: Optional[bool] = None
+        self.posted = 0
+        self.rejected = 0
+        self.compensated = 0
+
+    async def _use_transactions(self) -> bool:
+        if self.transactions in ("true", "false"):
+            return self.transactions == "true"
+        if self._supports_transactions is None:
+            try:
+                hello = await get_database().command("hello")
+                self._supports_transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+            except Exception as e:
+                print(f"Error probing transaction support, posting without transactions: {e}")
+                self._supports_transactions = False
+        return self._supports_transactions
+
+    async def _move_balance(
+        self,
+        user_id: str,
+        amount: float,
+        allow_negative: bool,
+        expected_balance: Optional[float],
+        session=None
+    ) -> float:
+        database = get_database()
+        condition: Dict[str, Any] = {"id": user_id}
+        if expected_balance is not None:
+            condition["balance"] = expected_balance
+        elif amount < 0 and not allow_negative:
+            condition["balance"] = {"$gte": -amount}
+
+        # One round trip: the filter is the guard, $inc the change
+        previous = await database.users.find_one_and_update(
+            condition,
+            {"$inc": {"balance": amount}},
+            projection={"_id": 0, "balance": 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if previous is None:
+            if not await database.users.find_one({"id": user_id}, {"_id": 1}, session=session):
+                raise AccountNotFoundError(f"User {user_id} not found")
+            if expected_balance is not None:
+                raise BalanceConflictError(f"Balance of user {user_id} changed concurrently")
+            raise InsufficientFundsError("Insufficient balance")
+        # Same double addition the server's $inc performed
+        return previous.get("balance", 0) + amount
+
+    async def _apply(
+        self,
+        user_id: str,
+        amount: float,
+        entries: List[Dict[str, Any]],
+        allow_negative: bool,
+        expected_balance: Optional[float],
+        session=None
+    ) -> Dict[str, Any]:
+        database = get_database()
+        # Entries first: the unique (txn_id, account) index turns a repeated txn_id away before any balance moves
+        await database[LEDGER_COLLECTION].insert_many(entries, session=session)
+        try:
+            balance = await self._move_balance(user_id, amount, allow_negative, expected_balance, session)
+        except LedgerError:
+            await database[LEDGER_COLLECTION].delete_many({"id": {"$in": [entry["id"] for entry in entries]}}, session=session)
+            raise
+
+        entries[0]["balance_after"] = balance
+        await database[LEDGER_COLLECTION].update_one(
+            {"id": entries[0]["id"]}, {"$set": {"balance_after": balance}}, session=session
+        )
+        return {"balance": balance}
+
+    async def post(
+        self,
+        user_id: str,
+        amount: float,
+        counterparty: str,
+        kind: str,
+        reference: Optional[str] = None,
+        description: str = "",
+        allow_negative: bool = False,
+        expected_balance: Optional[float] = None,
+        txn_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Move `amount` into (positive) or out of (negative) a user's wallet against a counterparty
+
+        Writes a balanced pair of entries and returns the transaction with the new balance.
+        Debits that would overdraw the wallet raise InsufficientFundsError unless allow_negative.
+        A caller-chosen txn_id makes the post idempotent: repeats raise DuplicateTransactionError.
+        """
+        txn_id = txn_id or str(uuid.uuid4())
+        now = datetime.utcnow()
+        entries = [
+            {"id": str(uuid.uuid4()), "txn_id": txn_id, "account": account, "amount": value,
+             "kind": kind, "reference": reference, "description": description, "created_at": now}
+            for account, value in ((user_account(user_id), amount), (counterparty, -amount))
+        ]
+
+        try:
+            if await self._use_transactions():
+                async with await db.client.start_session() as session:
+                    async def callback(session):
+                        # with_transaction may retry on transient errors; start from fresh entries each time
+                        return await self._apply(
+                            user_id, amount, [dict(entry) for entry in entries], allow_negative, expected_balance, session
+                        )
+                    user = await session.with_transaction(callback)
+            else:
+                user = await self._standalone(user_id, amount, entries, allow_negative, expected_balance)
+        except LedgerError:
+            self.rejected += 1
+            raise
+        except (DuplicateKeyError, BulkWriteError) as e:
+            if not _is_duplicate(e):
+                raise
+            # The unique (txn_id, account) index rejected the entries before the balance moved
+            self.rejected += 1
+            raise DuplicateTransactionError(f"Ledger transaction {txn_id} already posted")
+
+        self.posted += 1
+        return {"txn_id": txn_id, "user_id": user_id, "amount": amount, "balance": user["balance"]}
+
+    async def _standalone(
+        self,
+        user_id: str,
+        amount: float,
+        entries: List[Dict[str, Any]],
+        allow_negative: bool,
+        expected_balance: Optional[float]
+    ) -> Dict[str, Any]:
+        try:
+            return await self._apply(user_id, amount, entries, allow_negative, expected_balance)
+        except LedgerError:
+            raise
+        except Exception as e:
+            if "balance_after" in entries[0]:
+                # Balance and entries are both written; only the balance_after annotation is missing
+                print(f"Error recording balance_after of ledger transaction {entries[0]['txn_id']}: {e}")
+                return {"balance": entries[0]["balance_after"]}
+            # Some entries may be written without the balance having moved; remove ours (never by txn_id,
+            # which would take a duplicate's original entries with them)
+            await get_database()[LEDGER_COLLECTION].delete_many({"id": {"$in": [entry["id"] for entry in entries]}})
+            if not _is_duplicate(e):
+                self.compensated += 1
+            raise
+
+    async def set_balance(self, user_id: str, target: float, reference: Optional[str] = None, attempts: int = 5) -> Dict[str, Any]:
+        """Post the adjustment that brings a wallet to `target` (compare-and-set, retried on conflicts)"""
+        for attempt in range(attempts):
+            user = await get_database().users.find_one({"id": user_id}, {"_id": 0, "balance": 1})
+            if user is None:
+                raise AccountNotFoundError(f"User {user_id} not found")
+            current = user.get("balance", 0)
+            if current == target:
+                return {"txn_id": None, "user_id": user_id, "amount": 0, "balance": current}
+            try:
+                return await self.post(
+                    user_id, target - current, ADJUSTMENTS_ACCOUNT, "adjustment",
+                    reference=reference, description="Balance set by admin",
+                    allow_negative=True, expected_balance=current
+                )
+            except BalanceConflictError:
+                if attempt == attempts - 1:
+                    raise
+
+    async def get_entries(self, account: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent ledger entries of an account"""
+        return await get_database()[LEDGER_COLLECTION].find(
+            {"account": account}, {"_id": 0}
+        ).sort("created_at", -1).limit(limit).to_list(limit)
+
+    async def find_drift(self) -> List[Dict[str, Any]]:
+        """Users whose stored balance differs from the sum of their ledger entries"""
+        database = get_database()
+        sums = await database[LEDGER_COLLECTION].aggregate([
+            {"$match": {"account": {"$regex": "^user:"}}},
+            {"$group": {"_id": "$account", "total": {"$sum": "$amount"}}}
+        ]).to_list(None)
+        totals = {row["_id"]: row["total"] for row in sums}
+
+        drift = []
+        async for user in database.users.find({}, {"_id": 0, "id": 1, "balance": 1}):
+            ledger_total = totals.get(user_account(user["id"]), 0)
+            if abs(ledger_total - user.get("balance", 0)) > 1e-6:
+                drift.append({"user_id": user["id"], "balance": user.get("balance", 0), "ledger": ledger_total})
+        return drift
+
+    async def record_opening_balances(self) -> int:
+        """Write opening entries for balances that predate the ledger (balances themselves are untouched)"""
+        now = datetime.utcnow()
+        opened = 0
+        for row in await self.find_drift():
+            txn_id = str(uuid.uuid4())
+            difference = row["balance"] - row["ledger"]
+            await get_database()[LEDGER_COLLECTION].insert_many([
+                {"id": str(uuid.uuid4()), "txn_id": txn_id, "account": account, "amount": value,
+                 "kind": "opening", "reference": None, "description": "Opening balance", "created_at": now}
+                for account, value in ((user_account(row["user_id"]), difference), (OPENING_ACCOUNT, -difference))
+            ])
+            opened += 1
+        return opened
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get posting counters"""
+        return {
+            "transactions": self._supports_transactions if self.transactions == "auto" else self.transactions == "true",
+            "posted": self.posted,
+            "rejected": self.rejected,
+            "compensated": self.compensated
+        }
+
+# Global instance
+ledger_service = LedgerService()
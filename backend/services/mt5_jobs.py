@@ -0,0 +1,82 @@
+import os
+from datetime import datetime
+from typing import Dict, Any
+from database import get_database
+from services.ledger_service import ledger_service, DuplicateTransactionError, mt5_account
+from services.mt5_service import mt5_service, MT5NotAppliedError
+from services.work_queue import work_queue
+from utils.auth import invalidate_user
+
+# Bridge calls of one kind in flight per process, so a backlog can't flood the MT5 bridge
+MT5_JOB_CONCURRENCY = int(os.getenv("MT5_JOB_CONCURRENCY", "2"))
+MT5_JOB_TIMEOUT = float(os.getenv("MT5_JOB_TIMEOUT", "60"))
+
+# Queue priorities: money movements before account provisioning
+BALANCE_PRIORITY = 10
+ACCOUNT_PRIORITY = 5
+
+async def handle_balance_operation(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a deposit/withdrawal to an MT5 login"""
+    await mt5_service.apply_balance_operation(
+        login_id=payload["login_id"],
+        amount=payload["amount"],
+        txn_type=payload.get("txn_type", 0),
+        description=payload.get("description", "Balance update"),
+        comment=payload.get("comment", "")
+    )
+    return {"login_id": payload["login_id"], "amount": payload["amount"]}
+
+async def reverse_balance_operation(payload: Dict[str, Any]) -> bool:
+    """Undo the wallet side of a balance operation that MT5 did not apply; False if it had none"""
+    ledger = payload.get("ledger")
+    if not ledger:
+        return False
+    try:
+        await ledger_service.post(
+            ledger["user_id"],
+            -payload["amount"],
+            mt5_account(payload["login_id"]),
+            "mt5_balance_reversal",
+            reference=ledger["txn_id"],
+            description="MT5 balance operation failed",
+            allow_negative=True,
+            txn_id=f"reversal:{ledger['txn_id']}"
+        )
+    except DuplicateTransactionError:
+        pass
+    invalidate_user(ledger["user_id"])
+    return True
+
+async def handle_create_account(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Create an MT5 account and link it to the user"""
+    result = await mt5_service.create_account(payload["account_data"])
+    if not result:
+        raise RuntimeError("Failed to create MT5 account")
+
+    new_account = {
+        "login": result.get("login", 12345),
+        "server": payload["server"],
+        "group": payload["group"],
+        "leverage": payload["leverage"],
+        "created_at": datetime.utcnow().isoformat()
+    }
+    await get_database().users.update_one(
+        {"id": payload["user_id"]},
+        {"$push": {"mt5_accounts": new_account}}
+    )
+    invalidate_user(payload["user_id"])
+    return {"account": new_account}
+
+# A failed or timed-out balance operation may still have been applied by the bridge, so it is never
+# repeated. Its wallet movement is reversed only when MT5 certainly didn't apply it; otherwise the
+# dead-lettered job waits for an admin to reconcile it
+work_queue.register(
+    "mt5.balance_operation", handle_balance_operation,
+    concurrency=MT5_JOB_CONCURRENCY, timeout=MT5_JOB_TIMEOUT, max_attempts=1,
+    compensate=reverse_balance_operation, not_applied=(MT5NotAppliedError,)
+)
+# Creating an account isn't idempotent on the bridge, so a failed attempt is never repeated
+work_queue.register(
+    "mt5.create_account", handle_create_account,
+    concurrency=MT5_JOB_CONCURRENCY, timeout=MT5_JOB_TIMEOUT, max_attempts=1
+)
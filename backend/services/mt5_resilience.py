@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import Optional, Dict, Any
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+class ConcurrencyLimitError(Exception):
+    """Raised when a call waited too long for a concurrency slot"""
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with half-open probing"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are currently being rejected outright"""
+        return self.state == self.OPEN and time.monotonic() < self.opened_at + self.reset_timeout
+
+    def acquire(self):
+        """Admit a call or raise CircuitOpenError"""
+        if self.state == self.OPEN:
+            if time.monotonic() < self.opened_at + self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError("MT5 bridge circuit is open")
+            self.state = self.HALF_OPEN
+            self.probes_in_flight = 0
+
+        if self.state == self.HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError("MT5 bridge circuit is half-open; probe in flight")
+            self.probes_in_flight += 1
+
+    def release(self, success: Optional[bool]):
+        """Record the outcome of an admitted call (None when it was cancelled)"""
+        if self.state == self.HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+        if success is None:
+            return
+        if success:
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            return
+
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            self.times_opened += 1
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get breaker state and counters"""
+        return {
+            "state": self.OPEN if self.is_open else (self.HALF_OPEN if self.state != self.CLOSED else self.CLOSED),
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit: grow while calls are fast, back off on slow or failed calls"""
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        latency_target: float = 1.0,
+        backoff_ratio: float = 0.9,
+        failure_backoff_ratio: float = 0.5,
+        queue_timeout: float = 5.0
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.failure_backoff_ratio = failure_backoff_ratio
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        async with self._condition:
+            try:
+                await asyncio.wait_for(
+                    self._condition.wait_for(lambda: self.in_flight < int(self.limit)),
+                    timeout=self.queue_timeout
+                )
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise ConcurrencyLimitError("MT5 bridge concurrency limit reached")
+            self.in_flight += 1
+
+    async def release(self, latency: float, success: Optional[bool]):
+        """Free a slot and adjust the limit from the call's outcome"""
+        async with self._condition:
+            self.in_flight -= 1
+            if success is False:
+                self.limit = max(self.min_limit, self.limit * self.failure_backoff_ratio)
+            elif success and latency > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            elif success and self.in_flight + 1 >= int(self.limit):
+                # Only grow when the limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get the current limit and counters"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "rejected": self.rejected
+        }
@@ -1,10 +1,36 @@
+import asyncio
 import httpx
 import os
-from typing import Optional, Dict, Any, List
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable, AsyncIterator, Tuple
 from datetime import datetime, timedelta
 from models.mt5 import MT5AccountInfo, MT5Position, MT5Order, MT5TradeRequest, MT5HistoryRequest, MT5ChartRequest
+from services.mt5_session import MT5SessionManager
+from services.mt5_resilience import CircuitBreaker, AdaptiveConcurrencyLimiter, CircuitOpenError, ConcurrencyLimitError
+from utils.cache import TTLCache
+from utils.singleflight import SingleFlight
 import json
 
+# Bridge responses that mean the manager session is gone
+AUTH_FAILURE_STATUSES = (401, 403)
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package needed for HTTP/2 is installed"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class MT5BridgeError(Exception):
+    """Raised when the MT5 bridge returns an unusable response"""
+
+class MT5NotAppliedError(MT5BridgeError):
+    """The bridge certainly did not carry out the request: it was never sent, or it was rejected"""
+
+# Failures that happen before a request reaches the bridge
+NOT_SENT_ERRORS = (CircuitOpenError, ConcurrencyLimitError, httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
 class MT5Service:
     def __init__(self):
         self.base_url = os.getenv("MT5_API_BASE_URL", "http://173.208.156.141:6700")
@@ -12,44 +38,146 @@ class MT5Service:
         self.manager_password = os.getenv("MT5_MANAGER_PASSWORD", "Trade@2022")
         self.server_ip = os.getenv("MT5_SERVER_IP", "173.208.156.141")
         self.token = None
-        self.logged_in = False
+        self.session = MT5SessionManager(self)
+
+        # Connection pool settings for the shared bridge client
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("MT5_HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("MT5_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("MT5_HTTP_KEEPALIVE_EXPIRY", "30"))
+        )
+        self.http2 = os.getenv("MT5_HTTP2", "true").lower() == "true" and _http2_available()
+
+        # Per-operation timeouts (seconds)
+        connect_timeout = float(os.getenv("MT5_TIMEOUT_CONNECT", "5"))
+        self.timeouts = {
+            "auth": httpx.Timeout(float(os.getenv("MT5_TIMEOUT_AUTH", "10")), connect=connect_timeout),
+            "read": httpx.Timeout(float(os.getenv("MT5_TIMEOUT_READ", "10")), connect=connect_timeout),
+            "history": httpx.Timeout(float(os.getenv("MT5_TIMEOUT_HISTORY", "30")), connect=connect_timeout),
+            "trade": httpx.Timeout(float(os.getenv("MT5_TIMEOUT_TRADE", "30")), connect=connect_timeout)
+        }
+        self.client: Optional[httpx.AsyncClient] = None
+
+        # Fail fast when the bridge is down, and adapt outbound concurrency to its latency
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("MT5_BREAKER_FAILURE_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("MT5_BREAKER_RESET_SECONDS", "30")),
+            half_open_max_calls=int(os.getenv("MT5_BREAKER_HALF_OPEN_CALLS", "1"))
+        )
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=int(os.getenv("MT5_LIMIT_INITIAL", "20")),
+            min_limit=int(os.getenv("MT5_LIMIT_MIN", "1")),
+            max_limit=self.limits.max_connections,
+            latency_target=float(os.getenv("MT5_LIMIT_LATENCY_TARGET", "1.0")),
+            queue_timeout=float(os.getenv("MT5_LIMIT_QUEUE_TIMEOUT", "5"))
+        )
+
+        # Short-TTL read-through cache for per-login reads, keyed by (resource, login_id)
+        self.cache_ttls = {
+            "account": float(os.getenv("MT5_CACHE_TTL_ACCOUNT", "2")),
+            "positions": float(os.getenv("MT5_CACHE_TTL_POSITIONS", "2")),
+            "orders": float(os.getenv("MT5_CACHE_TTL_ORDERS", "5"))
+        }
+        self.cache = TTLCache(
+            max_size=int(os.getenv("MT5_CACHE_MAX_ENTRIES", "10000")),
+            stale_ttl=float(os.getenv("MT5_CACHE_STALE_SECONDS", "10"))
+        )
+        self._cache_versions: Dict[int, int] = {}
+        self._refreshing: Dict[tuple, asyncio.Task] = {}
+
+        # Identical concurrent reads for the same (resource, login_id) share one bridge call
+        self.coalescer = SingleFlight()
+
+        # Default number of logins fetched at once by batch snapshots
+        self.snapshot_concurrency = int(os.getenv("MT5_SNAPSHOT_CONCURRENCY", "20"))
+
+    async def start(self):
+        """Create the shared, connection-pooled HTTP client"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeouts["read"],
+                http2=self.http2
+            )
+        await self.session.start()
+
+    async def close(self):
+        """Close the shared HTTP client and release pooled connections"""
+        await self.session.stop()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _request(self, method: str, path: str, operation: str = "read", **kwargs) -> httpx.Response:
+        """Send a request to the MT5 bridge over the shared client"""
+        if self.client is None:
+            # Fallback for code paths running outside the app lifespan (scripts, shells)
+            await self.start()
+
+        self.breaker.acquire()
+        success = None
+        try:
+            await self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = await self.client.request(method, path, timeout=self.timeouts[operation], **kwargs)
+                # Only transport errors and 5xx count against the bridge; 4xx are caller errors
+                success = response.status_code < 500
+                return response
+            except httpx.TransportError:
+                success = False
+                raise
+            finally:
+                await self.limiter.release(time.monotonic() - started, success)
+        finally:
+            self.breaker.release(success)
+
+    async def _session_request(self, method: str, path: str, operation: str = "read", **kwargs) -> httpx.Response:
+        """Send a request inside the manager session, re-logging in once on auth failure"""
+        await self.session.ensure_session()
+        generation = self.session.generation
+        response = await self._request(method, path, operation=operation, **kwargs)
+        if response.status_code in AUTH_FAILURE_STATUSES:
+            self.session.invalidate(generation)
+            await self.session.ensure_session()
+            response = await self._request(method, path, operation=operation, **kwargs)
+        return response
 
     async def get_token(self) -> Optional[str]:
         """Get authentication token from MT5 API"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/token",
-                    json={
-                        "userName": self.manager_id,
-                        "password": self.manager_password
-                    }
-                )
-                if response.status_code == 200:
-                    self.token = response.text.strip('"')
-                    return self.token
-                return None
+            response = await self._request(
+                "POST",
+                "/Home/token",
+                operation="auth",
+                json={
+                    "userName": self.manager_id,
+                    "password": self.manager_password
+                }
+            )
+            if response.status_code == 200:
+                self.token = response.text.strip('"')
+                return self.token
+            return None
         except Exception as e:
             print(f"Error getting token: {e}")
             return None
 
     async def login(self) -> bool:
-        """Login to MT5 API"""
-        try:
-            if not self.token:
-                await self.get_token()
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/login",
-                    json={
-                        "mngId": int(self.manager_id) if self.manager_id.isdigit() else 0,
-                        "pwd": self.manager_password,
-                        "srvIp": self.server_ip
-                    }
-                )
-                self.logged_in = response.status_code == 200
-                return self.logged_in
+        """Login to MT5 API (use session.refresh() to share one in-flight login)"""
+        try:
+            response = await self._request(
+                "POST",
+                "/Home/login",
+                operation="auth",
+                json={
+                    "mngId": int(self.manager_id) if self.manager_id.isdigit() else 0,
+                    "pwd": self.manager_password,
+                    "srvIp": self.server_ip
+                }
+            )
+            return response.status_code == 200
         except Exception as e:
             print(f"Error logging in: {e}")
             return False
@@ -57,29 +185,86 @@ class MT5Service:
     async def logout(self) -> bool:
         """Logout from MT5 API"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(f"{self.base_url}/Home/logout")
-                self.logged_in = False
-                return response.status_code == 200
+            response = await self._request("POST", "/Home/logout", operation="auth")
+            self.session.reset()
+            return response.status_code == 200
         except Exception as e:
             print(f"Error logging out: {e}")
             return False
 
     async def ensure_logged_in(self):
         """Ensure we're logged in to MT5 API"""
-        if not self.logged_in:
-            await self.login()
+        await self.session.ensure_session()
+
+    async def _fetch_account_info(self, login_id: int) -> Optional[MT5AccountInfo]:
+        response = await self._session_request("GET", f"/Home/getUserInfo/{login_id}")
+        if response.status_code != 200:
+            raise MT5BridgeError(f"getUserInfo returned {response.status_code}")
+        data = response.json()
+        return MT5AccountInfo(**data) if data else None
+
+    async def _fetch_positions(self, login_id: int) -> List[MT5Position]:
+        response = await self._session_request("GET", f"/Home/getPosition/{login_id}")
+        if response.status_code != 200:
+            raise MT5BridgeError(f"getPosition returned {response.status_code}")
+        data = response.json()
+        return [MT5Position(**pos) for pos in data] if data else []
+
+    async def _fetch_orders(self, login_id: int) -> List[MT5Order]:
+        response = await self._session_request("GET", f"/Home/getPendingOrder/{login_id}")
+        if response.status_code != 200:
+            raise MT5BridgeError(f"getPendingOrder returned {response.status_code}")
+        data = response.json()
+        return [MT5Order(**order) for order in data] if data else []
+
+    async def _cached_read(self, resource: str, login_id: int, fetch: Callable[[int], Awaitable[Any]]) -> Any:
+        """Read-through cache lookup; stale entries are served while a refresh runs or the bridge is down"""
+        found, value, fresh = self.cache.get((resource, login_id))
+        if found:
+            if not fresh and not self.breaker.is_open:
+                self._schedule_refresh(resource, login_id, fetch)
+            return value
+        try:
+            return await self._load(resource, login_id, fetch)
+        except Exception:
+            # Bridge unavailable: serve the last known value, however old, if we have one
+            found, value, _ = self.cache.get((resource, login_id), allow_stale=True)
+            if found:
+                return value
+            raise
+
+    async def _load(self, resource: str, login_id: int, fetch: Callable[[int], Awaitable[Any]]) -> Any:
+        version = self._cache_versions.get(login_id, 0)
+        value = await self.coalescer.do((resource, login_id), lambda: fetch(login_id))
+        # Don't cache a result that was fetched before a trade/balance change invalidated the login
+        if self._cache_versions.get(login_id, 0) == version:
+            self.cache.set((resource, login_id), value, self.cache_ttls[resource])
+        return value
+
+    def _schedule_refresh(self, resource: str, login_id: int, fetch: Callable[[int], Awaitable[Any]]):
+        key = (resource, login_id)
+        if key in self._refreshing:
+            return
+        task = asyncio.create_task(self._refresh(resource, login_id, fetch))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def _refresh(self, resource: str, login_id: int, fetch: Callable[[int], Awaitable[Any]]):
+        try:
+            await self._load(resource, login_id, fetch)
+        except Exception as e:
+            print(f"Error refreshing cached MT5 {resource} for {login_id}: {e}")
+
+    def invalidate_login(self, login_id: int):
+        """Drop every cached resource for a login after it changed"""
+        self._cache_versions[login_id] = self._cache_versions.get(login_id, 0) + 1
+        for resource in self.cache_ttls:
+            self.cache.delete((resource, login_id))
 
     async def get_account_info(self, login_id: int) -> Optional[MT5AccountInfo]:
         """Get account information"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/Home/getUserInfo/{login_id}")
-                if response.status_code == 200:
-                    data = response.json()
-                    return MT5AccountInfo(**data) if data else None
-                return None
+            return await self._cached_read("account", login_id, self._fetch_account_info)
         except Exception as e:
             print(f"Error getting account info: {e}")
             return None
@@ -87,13 +272,7 @@ class MT5Service:
     async def get_positions(self, login_id: int) -> List[MT5Position]:
         """Get open positions"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/Home/getPosition/{login_id}")
-                if response.status_code == 200:
-                    data = response.json()
-                    return [MT5Position(**pos) for pos in data] if data else []
-                return []
+            return await self._cached_read("positions", login_id, self._fetch_positions)
         except Exception as e:
             print(f"Error getting positions: {e}")
             return []
@@ -101,34 +280,66 @@ class MT5Service:
     async def get_orders(self, login_id: int) -> List[MT5Order]:
         """Get pending orders"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/Home/getPendingOrder/{login_id}")
-                if response.status_code == 200:
-                    data = response.json()
-                    return [MT5Order(**order) for order in data] if data else []
-                return []
+            return await self._cached_read("orders", login_id, self._fetch_orders)
         except Exception as e:
             print(f"Error getting orders: {e}")
             return []
 
+    async def get_live_state(self, login_id: int) -> Tuple[Optional[MT5AccountInfo], List[MT5Position]]:
+        """Fetch account info and positions straight from the bridge, refreshing the cache; raises on errors"""
+        account, positions = await asyncio.gather(
+            self._load("account", login_id, self._fetch_account_info),
+            self._load("positions", login_id, self._fetch_positions)
+        )
+        return account, positions
+
+    async def _account_snapshot(self, login_id: int, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        async with semaphore:
+            account, positions, orders = await asyncio.gather(
+                self.get_account_info(login_id),
+                self.get_positions(login_id),
+                self.get_orders(login_id)
+            )
+        return {
+            "login": login_id,
+            "ok": account is not None,
+            "account": account.dict() if account else None,
+            "positions": [pos.dict() for pos in positions],
+            "orders": [order.dict() for order in orders]
+        }
+
+    async def iter_account_snapshots(self, login_ids: List[int], concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Fetch account info, positions and orders for many logins, yielding each as it completes"""
+        semaphore = asyncio.Semaphore(concurrency or self.snapshot_concurrency)
+        tasks = [
+            asyncio.create_task(self._account_snapshot(login_id, semaphore))
+            for login_id in dict.fromkeys(login_ids)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding fetches if the consumer goes away early
+            for task in tasks:
+                task.cancel()
+
     async def get_trade_history(self, login_id: int, start_date: str, end_date: str) -> List[Dict]:
         """Get trade history"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/tradehistory",
-                    json={
-                        "loginId": login_id,
-                        "startDate": start_date,
-                        "endDate": end_date
-                    }
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    return data if data else []
-                return []
+            response = await self._session_request(
+                "POST",
+                "/Home/tradehistory",
+                operation="history",
+                json={
+                    "loginId": login_id,
+                    "startDate": start_date,
+                    "endDate": end_date
+                }
+            )
+            if response.status_code == 200:
+                data = response.json()
+                return data if data else []
+            return []
         except Exception as e:
             print(f"Error getting trade history: {e}")
             return []
@@ -136,35 +347,51 @@ class MT5Service:
     async def create_account(self, account_data: Dict[str, Any]) -> Optional[Dict]:
         """Create new MT5 account"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/createAccount",
-                    json=account_data
-                )
-                if response.status_code == 200:
-                    return response.json()
-                return None
+            response = await self._session_request(
+                "POST",
+                "/Home/createAccount",
+                operation="trade",
+                json=account_data
+            )
+            if response.status_code == 200:
+                return response.json()
+            return None
         except Exception as e:
             print(f"Error creating account: {e}")
             return None
 
+    async def apply_balance_operation(self, login_id: int, amount: float, txn_type: int, description: str, comment: str = ""):
+        """Perform balance operation (deposit/withdraw); raises MT5NotAppliedError if it certainly didn't happen
+
+        Any other error leaves the outcome unknown: the bridge may have applied the operation.
+        """
+        try:
+            response = await self._session_request(
+                "POST",
+                "/Home/balanceOP",
+                operation="trade",
+                json={
+                    "loginid": login_id,
+                    "amount": amount,
+                    "txnType": txn_type,
+                    "description": description,
+                    "comment": comment
+                }
+            )
+        except NOT_SENT_ERRORS as e:
+            raise MT5NotAppliedError(f"balanceOP not sent: {str(e) or type(e).__name__}") from e
+        if response.status_code == 200:
+            self.invalidate_login(login_id)
+            return
+        if 400 <= response.status_code < 500:
+            raise MT5NotAppliedError(f"balanceOP rejected with {response.status_code}")
+        raise MT5BridgeError(f"balanceOP returned {response.status_code}")
+
     async def balance_operation(self, login_id: int, amount: float, txn_type: int, description: str, comment: str = "") -> bool:
         """Perform balance operation (deposit/withdraw)"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/balanceOP",
-                    json={
-                        "loginid": login_id,
-                        "amount": amount,
-                        "txnType": txn_type,
-                        "description": description,
-                        "comment": comment
-                    }
-                )
-                return response.status_code == 200
+            await self.apply_balance_operation(login_id, amount, txn_type, description, comment)
+            return True
         except Exception as e:
             print(f"Error performing balance operation: {e}")
             return False
@@ -172,15 +399,16 @@ class MT5Service:
     async def open_trade(self, trade_request: MT5TradeRequest) -> Optional[Dict]:
         """Open a new trade"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/sendOpenTrade",
-                    json=trade_request.dict()
-                )
-                if response.status_code == 200:
-                    return response.json()
-                return None
+            response = await self._session_request(
+                "POST",
+                "/Home/sendOpenTrade",
+                operation="trade",
+                json=trade_request.dict()
+            )
+            if response.status_code == 200:
+                self.invalidate_login(trade_request.loginid)
+                return response.json()
+            return None
         except Exception as e:
             print(f"Error opening trade: {e}")
             return None
@@ -188,15 +416,16 @@ class MT5Service:
     async def close_trade(self, trade_request: MT5TradeRequest) -> Optional[Dict]:
         """Close a trade"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/sendCloseTrade",
-                    json=trade_request.dict()
-                )
-                if response.status_code == 200:
-                    return response.json()
-                return None
+            response = await self._session_request(
+                "POST",
+                "/Home/sendCloseTrade",
+                operation="trade",
+                json=trade_request.dict()
+            )
+            if response.status_code == 200:
+                self.invalidate_login(trade_request.loginid)
+                return response.json()
+            return None
         except Exception as e:
             print(f"Error closing trade: {e}")
             return None
@@ -204,22 +433,32 @@ class MT5Service:
     async def get_chart_data(self, symbol: str, start_date: str, end_date: str) -> Optional[Dict]:
         """Get chart data"""
         try:
-            await self.ensure_logged_in()
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/Home/getchart",
-                    json={
-                        "symbol": symbol,
-                        "from": start_date,
-                        "to": end_date
-                    }
-                )
-                if response.status_code == 200:
-                    return response.json()
-                return None
+            response = await self._session_request(
+                "POST",
+                "/Home/getchart",
+                operation="history",
+                json={
+                    "symbol": symbol,
+                    "from": start_date,
+                    "to": end_date
+                }
+            )
+            if response.status_code == 200:
+                return response.json()
+            return None
         except Exception as e:
             print(f"Error getting chart data: {e}")
             return None
 
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get MT5 bridge metrics"""
+        return {
+            "session": self.session.get_metrics(),
+            "breaker": self.breaker.get_metrics(),
+            "limiter": self.limiter.get_metrics(),
+            "cache": self.cache.get_metrics(),
+            "coalescing": self.coalescer.get_metrics()
+        }
+
 # Global instance
-mt5_service = MT5Service()
\ No newline at end of file
+mt5_service = MT5Service()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+from typing import Optional, Dict, Any
+from utils.singleflight import SingleFlight
+
+class MT5SessionManager:
+    """Track the MT5 bridge manager session and refresh it before it expires"""
+
+    def __init__(self, service):
+        self.service = service
+        self.ttl = float(os.getenv("MT5_SESSION_TTL_SECONDS", "1800"))
+        self.refresh_margin = float(os.getenv("MT5_SESSION_REFRESH_MARGIN", "120"))
+        self.retry_interval = float(os.getenv("MT5_SESSION_RETRY_INTERVAL", "5"))
+        self.logged_in = False
+        self.expires_at = 0.0
+        self.generation = 0
+        self.logins = 0
+        self.login_failures = 0
+        self._singleflight = SingleFlight()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_valid(self) -> bool:
+        """Whether the current session can still be used"""
+        return self.logged_in and time.monotonic() < self.expires_at
+
+    async def ensure_session(self) -> bool:
+        """Make sure a valid session exists, logging in if needed"""
+        if self.is_valid:
+            return True
+        return await self.refresh()
+
+    async def refresh(self) -> bool:
+        """Log in again; concurrent callers share one in-flight login"""
+        return await self._singleflight.do("login", self._login)
+
+    async def _login(self) -> bool:
+        self.logins += 1
+        await self.service.get_token()
+        success = await self.service.login()
+        if success:
+            self.logged_in = True
+            self.expires_at = time.monotonic() + self.ttl
+            self.generation += 1
+        else:
+            self.logged_in = False
+            self.login_failures += 1
+        return success
+
+    def invalidate(self, generation: int):
+        """Drop the session after an auth failure seen while using `generation`"""
+        # A request that started on an older session must not invalidate a newer one
+        if generation == self.generation:
+            self.logged_in = False
+
+    def reset(self):
+        """Forget the current session (after logout)"""
+        self.logged_in = False
+        self.expires_at = 0.0
+
+    async def start(self):
+        """Start the background refresh loop"""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Stop the background refresh loop"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        delay = self.retry_interval
+        while True:
+            await asyncio.sleep(delay)
+            if not self.logged_in:
+                # Nothing to keep alive; the next request logs in on demand
+                delay = self.retry_interval
+                continue
+
+            remaining = self.expires_at - self.refresh_margin - time.monotonic()
+            if remaining > 0:
+                delay = remaining
+                continue
+
+            try:
+                success = await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing MT5 session: {e}")
+                success = False
+            # On failure keep the old session until it expires and retry soon
+            delay = self.retry_interval if not success else max(self.ttl - self.refresh_margin, self.retry_interval)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get session metrics"""
+        return {
+            "logged_in": self.logged_in,
+            "expires_in": max(0.0, self.expires_at - time.monotonic()) if self.logged_in else 0.0,
+            "logins": self.logins,
+            "login_failures": self.login_failures,
+            "login_in_flight": self._singleflight.in_flight() > 0
+        }
@@ -0,0 +1,139 @@
+import asyncio
+import os
+from typing import Dict, Any, List, Set
+from services.mt5_service import mt5_service
+
+# Account fields pushed to subscribers when they change
+ACCOUNT_FIELDS = ("balance", "equity", "margin", "free_margin", "profit", "credit")
+
+def _position_key(position: Dict[str, Any]) -> Any:
+    return position.get("positionid") or position.get("id") or position.get("dealId")
+
+class MT5StreamHub:
+    """Fan out MT5 account/position changes to subscribers with one poller per login"""
+
+    def __init__(self):
+        self.poll_interval = float(os.getenv("MT5_STREAM_POLL_INTERVAL", "1"))
+        self.queue_size = int(os.getenv("MT5_STREAM_QUEUE_SIZE", "100"))
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._pollers: Dict[int, asyncio.Task] = {}
+        self._accounts: Dict[int, Dict[str, Any]] = {}
+        self._positions: Dict[int, Dict[Any, Dict[str, Any]]] = {}
+        self.polls = 0
+        self.events_sent = 0
+
+    def subscribe(self, login_id: int) -> asyncio.Queue:
+        """Register a subscriber for a login, starting its poller if it is the first"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(login_id, set()).add(queue)
+        if login_id in self._accounts:
+            queue.put_nowait(self._snapshot_event(login_id))
+        if login_id not in self._pollers:
+            self._pollers[login_id] = asyncio.create_task(self._poll(login_id))
+        return queue
+
+    def unsubscribe(self, login_id: int, queue: asyncio.Queue):
+        """Remove a subscriber, stopping the poller when the last one leaves"""
+        subscribers = self._subscribers.get(login_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[login_id]
+            poller = self._pollers.pop(login_id, None)
+            if poller is not None:
+                poller.cancel()
+            self._accounts.pop(login_id, None)
+            self._positions.pop(login_id, None)
+
+    async def close(self):
+        """Stop every poller"""
+        pollers = list(self._pollers.values())
+        for poller in pollers:
+            poller.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+        self._pollers.clear()
+        self._subscribers.clear()
+        self._accounts.clear()
+        self._positions.clear()
+
+    async def _poll(self, login_id: int):
+        while True:
+            try:
+                self.polls += 1
+                account, positions = await mt5_service.get_live_state(login_id)
+                self._apply(login_id, account.dict() if account else {}, [pos.dict() for pos in positions])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error polling MT5 stream for {login_id}: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _apply(self, login_id: int, account: Dict[str, Any], positions: List[Dict[str, Any]]):
+        current_positions = {_position_key(pos): pos for pos in positions}
+
+        if login_id not in self._accounts:
+            self._accounts[login_id] = account
+            self._positions[login_id] = current_positions
+            self._publish(login_id, self._snapshot_event(login_id))
+            return
+
+        previous_account = self._accounts[login_id]
+        previous_positions = self._positions[login_id]
+        # Store the new state first so a resync snapshot for a slow consumer is current
+        self._accounts[login_id] = account
+        self._positions[login_id] = current_positions
+
+        changes = {
+            field: account.get(field)
+            for field in ACCOUNT_FIELDS
+            if account.get(field) != previous_account.get(field)
+        }
+        if changes:
+            self._publish(login_id, {
+                "type": "account",
+                "login": login_id,
+                "changes": changes,
+                "equity_delta": round((account.get("equity") or 0) - (previous_account.get("equity") or 0), 2)
+            })
+
+        upserted = [pos for key, pos in current_positions.items() if previous_positions.get(key) != pos]
+        removed = [key for key in previous_positions if key not in current_positions]
+        if upserted or removed:
+            self._publish(login_id, {
+                "type": "positions",
+                "login": login_id,
+                "upserted": upserted,
+                "removed": removed
+            })
+
+    def _snapshot_event(self, login_id: int) -> Dict[str, Any]:
+        return {
+            "type": "snapshot",
+            "login": login_id,
+            "account": self._accounts.get(login_id),
+            "positions": list(self._positions.get(login_id, {}).values())
+        }
+
+    def _publish(self, login_id: int, event: Dict[str, Any]):
+        for queue in self._subscribers.get(login_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and resync it with a full snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._snapshot_event(login_id))
+            self.events_sent += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get stream metrics"""
+        return {
+            "active_logins": len(self._pollers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "polls": self.polls,
+            "events_sent": self.events_sent
+        }
+
+# Global instance
+mt5_stream_hub = MT5StreamHub()
@@ -1,21 +1,19 @@
 import os
-import stripe
 import uuid
 from typing import Optional, Dict, Any
 from datetime import datetime
 from models.payment import PaymentCreate, PaymentInDB, PaymentResponse
-
-# Stripe configuration
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+from services.stripe_client import stripe_client
 
 class PaymentService:
     def __init__(self):
         self.stripe_publishable_key = os.getenv("STRIPE_PUBLISHABLE_KEY")
 
-    async def create_stripe_payment(self, amount: float, currency: str = "USD", user_id: str = None) -> Dict[str, Any]:
+    async def create_stripe_payment(self, amount: float, currency: str = "USD", user_id: str = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         """Create Stripe payment session"""
         try:
-            session = stripe.checkout.Session.create(
+            session = await stripe_client.create_checkout_session(
+                idempotency_key=idempotency_key,
                 payment_method_types=['card'],
                 line_items=[{
                     'price_data': {
@@ -105,7 +103,7 @@ class PaymentService:
         """Verify payment status"""
         try:
             if method == "stripe":
-                session = stripe.checkout.Session.retrieve(payment_id)
+                session = await stripe_client.retrieve_checkout_session(payment_id)
                 return {
                     'status': session.payment_status,
                     'amount': session.amount_total / 100,
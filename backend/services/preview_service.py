@@ -0,0 +1,137 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, Any, Set
+from database import get_database
+from services.blob_store import blob_store, read_blob, iter_bytes
+
+# Variant name -> longest edge in pixels
+PREVIEW_VARIANTS = {
+    "preview": int(os.getenv("PREVIEW_MAX_PX", "1600")),
+    "thumbnail": int(os.getenv("THUMBNAIL_MAX_PX", "256")),
+}
+PREVIEW_QUALITY = int(os.getenv("PREVIEW_WEBP_QUALITY", "80"))
+
+# Pillow cannot rasterise PDFs, so only image uploads get previews
+PREVIEWABLE_MIME_PREFIX = "image/"
+
+def render_previews(data: bytes, variants: Dict[str, int], quality: int) -> Dict[str, Dict[str, Any]]:
+    """Decode an image (first frame/page) and encode each variant as WebP; runs in a worker process"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        rendered = {}
+        for name, max_px in sorted(variants.items(), key=lambda item: -item[1]):
+            # Each smaller variant is derived from the previous one to avoid re-resampling the original
+            image.thumbnail((max_px, max_px), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, "WEBP", quality=quality, method=4)
+            rendered[name] = {"data": output.getvalue(), "width": image.width, "height": image.height}
+        return rendered
+
+def preview_urls(document: Dict[str, Any]) -> Dict[str, str]:
+    """API URLs of a document's generated previews, keyed by variant"""
+    return {
+        name: f"/api/documents/{document['id']}/preview?variant={name}"
+        for name in (document.get("previews") or {})
+    }
+
+class PreviewService:
+    """Generate downscaled WebP previews of uploaded documents in a process pool"""
+
+    def __init__(self):
+        self.enabled = os.getenv("PREVIEWS_ENABLED", "true").lower() == "true"
+        self.workers = int(os.getenv("PREVIEW_WORKERS", "2"))
+        self.max_source_bytes = int(os.getenv("PREVIEW_MAX_SOURCE_MB", "25")) * 1024 * 1024
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _previewable(self, mime_type: str, size: Optional[int]) -> bool:
+        return mime_type.startswith(PREVIEWABLE_MIME_PREFIX) and (size or 0) <= self.max_source_bytes
+
+    def initial_status(self, mime_type: str, size: Optional[int]) -> Optional[str]:
+        """preview_status to store with a new upload: None while previews are disabled"""
+        if not self.enabled:
+            return None
+        return "pending" if self._previewable(mime_type, size) else "unsupported"
+
+    def schedule(self, document: Dict[str, Any]):
+        """Generate previews for a freshly uploaded document without delaying the response"""
+        if document.get("preview_status") != "pending":
+            return
+        task = asyncio.create_task(self.generate(document))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def generate(self, document: Dict[str, Any]) -> Optional[str]:
+        """Render and store the previews for one document; returns the resulting preview_status"""
+        db = get_database()
+        if not document.get("blob_id") or not self._previewable(document["mime_type"], document.get("size")):
+            self.skipped += 1
+            await db.documents.update_one({"id": document["id"]}, {"$set": {"preview_status": "unsupported"}})
+            return "unsupported"
+
+        try:
+            data = await read_blob(document["blob_id"])
+            loop = asyncio.get_running_loop()
+            rendered = await loop.run_in_executor(
+                self._pool(), render_previews, data, PREVIEW_VARIANTS, PREVIEW_QUALITY
+            )
+            previews = {}
+            for name, variant in rendered.items():
+                blob = await blob_store.put(iter_bytes(variant["data"]))
+                previews[name] = {
+                    "blob_id": blob["blob_id"],
+                    "sha256": blob["sha256"],
+                    "size": blob["size"],
+                    "width": variant["width"],
+                    "height": variant["height"],
+                    "mime_type": "image/webp"
+                }
+            await db.documents.update_one(
+                {"id": document["id"]},
+                {"$set": {"previews": previews, "preview_status": "ready", "previews_generated_at": datetime.utcnow()}}
+            )
+            self.generated += 1
+            return "ready"
+        except Exception as e:
+            print(f"Error generating previews for document {document['id']}: {e}")
+            self.failed += 1
+            await db.documents.update_one({"id": document["id"]}, {"$set": {"preview_status": "failed"}})
+            return "failed"
+
+    async def shutdown(self):
+        """Wait for in-flight previews, then stop the worker processes"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get preview generation counters"""
+        return {
+            "workers": self.workers,
+            "in_flight": len(self._tasks),
+            "generated": self.generated,
+            "skipped": self.skipped,
+            "failed": self.failed
+        }
+
+# Global instance
+preview_service = PreviewService()
@@ -0,0 +1,129 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+from database import get_database
+
+STATS_COLLECTION = "stats_counters"
+
+# Counter document id (= source collection) -> fields whose per-value counts it keeps
+COUNTED_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "users": ("kyc_status", "is_active"),
+    "tickets": ("status", "priority"),
+    "documents": ("status", "document_type"),
+}
+
+# Model defaults for counted fields, so documents missing a field count the way the app reads them
+FIELD_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "users": {"kyc_status": "pending", "is_active": True},
+    "tickets": {"status": "open", "priority": "medium"},
+    "documents": {"status": "pending"},
+}
+
+def _key(value: Any) -> str:
+    # Field values become sub-document keys, which may not contain "." or start with "$"
+    return str(value).replace(".", "_").replace("$", "_")
+
+async def bump(scope: str, increments: Dict[str, int]):
+    """Apply $inc to a counter document; increments maps "field.value" (or "total") to a delta"""
+    increments = {key: delta for key, delta in increments.items() if delta}
+    if not increments:
+        return
+    await get_database()[STATS_COLLECTION].update_one(
+        {"_id": scope},
+        {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def record_created(scope: str, document: Dict[str, Any]):
+    """Count a newly inserted document"""
+    increments = {"total": 1}
+    for field in COUNTED_FIELDS[scope]:
+        increments[f"{field}.{_key(document.get(field, FIELD_DEFAULTS[scope].get(field)))}"] = 1
+    await bump(scope, increments)
+
+async def record_transition(scope: str, field: str, old_value: Any, new_value: Any):
+    """Move one document's count from old_value to new_value"""
+    if _key(old_value) == _key(new_value):
+        return
+    await bump(scope, {f"{field}.{_key(old_value)}": -1, f"{field}.{_key(new_value)}": 1})
+
+async def get_counters() -> Dict[str, Dict[str, Any]]:
+    """Every counter document keyed by scope"""
+    documents = await get_database()[STATS_COLLECTION].find({"_id": {"$in": list(COUNTED_FIELDS)}}).to_list(None)
+    return {document.pop("_id"): document for document in documents}
+
+async def reconcile_counters() -> Dict[str, Dict[str, Any]]:
+    """Recount every scope from its source collection and overwrite the counters (fixes drift)"""
+    db = get_database()
+
+    async def recount(scope: str) -> Dict[str, Any]:
+        fields = COUNTED_FIELDS[scope]
+        result = await db[scope].aggregate([{"$facet": {
+            "total": [{"$count": "count"}],
+            **{
+                field: [{"$group": {
+                    "_id": {"$ifNull": [f"${field}", FIELD_DEFAULTS[scope].get(field)]},
+                    "count": {"$sum": 1}
+                }}]
+                for field in fields
+            }
+        }}]).to_list(1)
+        facets = result[0] if result else {}
+        counters = {"total": facets["total"][0]["count"] if facets.get("total") else 0}
+        for field in fields:
+            counters[field] = {_key(bucket["_id"]): bucket["count"] for bucket in facets.get(field, [])}
+        counters["reconciled_at"] = counters["updated_at"] = datetime.utcnow()
+        # Increments landing between the count and this write are lost until the next run
+        await db[STATS_COLLECTION].replace_one({"_id": scope}, counters, upsert=True)
+        return counters
+
+    results = await asyncio.gather(*(recount(scope) for scope in COUNTED_FIELDS))
+    return dict(zip(COUNTED_FIELDS, results))
+
+class StatsReconciler:
+    """Periodically rebuild the counters so missed increments don't accumulate"""
+
+    def __init__(self):
+        self.enabled = os.getenv("STATS_RECONCILE_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+        self.runs = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the background reconciler (its first run seeds missing counters)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background reconciler"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await reconcile_counters()
+                self.runs += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error reconciling stats counters: {e}")
+            await asyncio.sleep(self.interval)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get reconciler settings and run count"""
+        return {
+            "enabled": self.enabled,
+            "interval_seconds": self.interval,
+            "runs": self.runs
+        }
+
+# Global instance
+stats_reconciler = StatsReconciler()
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+import stripe
+
+# Stripe configuration
+stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+stripe.api_base = os.getenv("STRIPE_API_BASE", stripe.api_base)
+
+# Retries are done here, with our own idempotency keys, rather than inside the SDK
+stripe.max_network_retries = 0
+
+class StripeClient:
+    """Run the synchronous Stripe SDK off the event loop with timeouts and idempotent retries"""
+
+    def __init__(self):
+        self.timeout = float(os.getenv("STRIPE_TIMEOUT", "15"))
+        self.max_retries = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+        self.retry_backoff = float(os.getenv("STRIPE_RETRY_BACKOFF", "0.5"))
+        self.workers = int(os.getenv("STRIPE_WORKERS", "16"))
+        # requests keeps a pooled session per worker thread
+        stripe.default_http_client = stripe.http_client.RequestsClient(timeout=self.timeout)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stripe")
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+            return True
+        return isinstance(error, stripe.error.APIError) and (error.http_status or 500) >= 500
+
+    async def _call(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs)),
+                    # The HTTP timeout applies per attempt; allow a little slack for queueing
+                    timeout=self.timeout * 2
+                )
+            except Exception as e:
+                if attempt >= self.max_retries or not (self._is_retryable(e) or isinstance(e, asyncio.TimeoutError)):
+                    self.failures += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+
+    async def create_checkout_session(self, idempotency_key: Optional[str] = None, **params) -> Any:
+        """Create a Checkout Session; retries reuse the same idempotency key"""
+        if idempotency_key:
+            params["idempotency_key"] = idempotency_key
+        return await self._call(stripe.checkout.Session.create, **params)
+
+    async def retrieve_checkout_session(self, session_id: str) -> Any:
+        """Retrieve a Checkout Session"""
+        return await self._call(stripe.checkout.Session.retrieve, session_id)
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get call/retry counters"""
+        return {
+            "workers": self.workers,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures
+        }
+
+# Global instance
+stripe_client = StripeClient()
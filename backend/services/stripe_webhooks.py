@@ -0,0 +1,87 @@
+from datetime import datetime
+from typing import Dict, Any
+from pymongo.errors import DuplicateKeyError
+from database import get_database
+from services.cashflow_service import complete_payment
+from services.ledger_service import ledger_service, DuplicateTransactionError, STRIPE_ACCOUNT
+from services.mt5_jobs import BALANCE_PRIORITY
+from services.work_queue import work_queue
+from utils.auth import invalidate_user
+
+EVENTS_COLLECTION = "stripe_events"
+
+# Stripe event type -> queue job type handling its side effects
+EVENT_JOBS = {
+    "checkout.session.completed": "stripe.checkout_completed",
+}
+
+async def accept_event(event: Dict[str, Any]) -> bool:
+    """Queue a webhook event's side effects and record it; False if the event id was seen before"""
+    events = get_database()[EVENTS_COLLECTION]
+    if await events.find_one({"_id": event["id"]}, {"_id": 1}):
+        return False
+
+    # Queue before recording: a crash in between leaves the event unrecorded, so Stripe's retry
+    # gets here again and the dedupe_key hands back the job that was already queued
+    job_type = EVENT_JOBS.get(event.get("type"))
+    if job_type:
+        await work_queue.enqueue(
+            job_type,
+            {"event_id": event["id"], "object": event.get("data", {}).get("object", {})},
+            dedupe_key=f"stripe-event:{event['id']}",
+            priority=BALANCE_PRIORITY
+        )
+
+    try:
+        await events.insert_one({"_id": event["id"], "type": event.get("type"), "received_at": datetime.utcnow()})
+    except DuplicateKeyError:
+        # A concurrent delivery of the same event recorded it first; both got the same job
+        return False
+    return True
+
+async def handle_checkout_completed(payload: Dict[str, Any]):
+    """Complete the payment, credit the wallet and queue the MT5 deposit"""
+    db = get_database()
+    session_id = payload["object"].get("id")
+
+    # None if it was already completed, e.g. by an earlier attempt of this job that failed later on
+    payment_doc = await complete_payment({"reference": session_id}) \
+        or await db.payments.find_one({"reference": session_id, "status": "completed"})
+    if not payment_doc:
+        # The checkout can complete before create_payment stored the record; retry with backoff
+        raise LookupError(f"No payment found for checkout session {session_id}")
+
+    try:
+        # Fixed txn_id: a retried job can't credit the deposit twice
+        await ledger_service.post(
+            payment_doc["user_id"],
+            payment_doc["amount"],
+            STRIPE_ACCOUNT,
+            "deposit",
+            reference=payment_doc["id"],
+            description="Stripe payment deposit",
+            txn_id=f"deposit:{payment_doc['id']}"
+        )
+    except DuplicateTransactionError:
+        pass
+    invalidate_user(payment_doc["user_id"])
+
+    user_doc = await db.users.find_one({"id": payment_doc["user_id"]}, {"_id": 0, "mt5_accounts": 1})
+    if user_doc and user_doc.get("mt5_accounts"):
+        login_id = user_doc["mt5_accounts"][0].get("login")
+        if login_id:
+            await work_queue.enqueue(
+                "mt5.balance_operation",
+                {
+                    "login_id": login_id,
+                    "amount": payment_doc["amount"],
+                    "txn_type": 0,  # Deposit
+                    "description": "Stripe payment deposit",
+                    "comment": f"Payment ID: {payment_doc['id']}"
+                },
+                dedupe_key=f"mt5-deposit:{payment_doc['id']}",
+                priority=BALANCE_PRIORITY,
+                user_id=payment_doc["user_id"]
+            )
+
+work_queue.register("stripe.checkout_completed", handle_checkout_completed)
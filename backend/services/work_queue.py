@@ -0,0 +1,406 @@
+import asyncio
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Set, Tuple, Type, Callable, Awaitable, AsyncIterator
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import get_database
+from utils.queries import projection
+
+QUEUE_COLLECTION = "work_queue"
+
+# A job in one of these states will not change again (until an admin re-queues a dead one)
+TERMINAL_STATUSES = ("done", "dead")
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+class WorkQueue:
+    """Durable Mongo-backed job queue: leased claims, retry with backoff, dead-lettering
+
+    Jobs are claimed highest priority first, then by when they became due. A claim leases
+    the job for lease_seconds (its visibility timeout) and the worker renews the lease while
+    the handler runs, so only jobs of crashed workers become visible again.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("WORK_QUEUE_ENABLED", "true").lower() == "true"
+        self.workers = int(os.getenv("WORK_QUEUE_WORKERS", "4"))
+        self.poll_interval = float(os.getenv("WORK_QUEUE_POLL_INTERVAL", "1"))
+        self.lease_seconds = float(os.getenv("WORK_QUEUE_LEASE_SECONDS", "60"))
+        self.max_attempts = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "8"))
+        self.backoff_base = float(os.getenv("WORK_QUEUE_BACKOFF_BASE", "2"))
+        self.backoff_max = float(os.getenv("WORK_QUEUE_BACKOFF_MAX", "600"))
+        self.shutdown_grace = float(os.getenv("WORK_QUEUE_SHUTDOWN_GRACE", "10"))
+        self._types: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, int] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._watchers: Dict[str, Set[asyncio.Event]] = {}
+        self._stopping = False
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.compensated = 0
+        self.unreconciled = 0
+
+    def register(
+        self,
+        job_type: str,
+        handler: Handler,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        compensate: Optional[Handler] = None,
+        not_applied: Tuple[Type[Exception], ...] = ()
+    ):
+        """Route jobs of job_type to handler(payload)
+
+        concurrency caps how many of these jobs this process runs at once and timeout bounds one
+        attempt. compensate(payload) undoes what was done outside the handler on the job's behalf
+        (e.g. the wallet side of an MT5 transfer) and returns whether it undid anything. It runs when
+        the job is dead-lettered with one of the not_applied errors, which prove the handler had no
+        effect; any other final error flags the job needs_reconciliation for an admin to resolve.
+        """
+        self._types[job_type] = {
+            "handler": handler,
+            "concurrency": concurrency,
+            "timeout": timeout,
+            "max_attempts": max_attempts,
+            "compensate": compensate,
+            "not_applied": not_applied
+        }
+        self._running.setdefault(job_type, 0)
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        dedupe_key: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        priority: int = 0,
+        run_at: Optional[datetime] = None,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Persist a job; a job with the same dedupe_key is only ever enqueued once
+
+        Higher priority runs first; run_at defers the first attempt; user_id owns the job's status.
+        """
+        now = datetime.utcnow()
+        job_settings = self._types.get(job_type, {})
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": max_attempts or job_settings.get("max_attempts") or self.max_attempts,
+            "available_at": run_at or now,
+            "user_id": user_id,
+            "created_at": now,
+            "updated_at": now
+        }
+        if dedupe_key:
+            job["dedupe_key"] = dedupe_key
+        try:
+            await get_database()[QUEUE_COLLECTION].insert_one(job)
+        except DuplicateKeyError:
+            if not dedupe_key:
+                raise
+            return await get_database()[QUEUE_COLLECTION].find_one({"dedupe_key": dedupe_key}, {"_id": 0})
+        job.pop("_id", None)
+        if job["available_at"] <= now:
+            self._wakeup.set()
+        return job
+
+    def _claimable_types(self) -> List[str]:
+        return [
+            job_type for job_type, settings in self._types.items()
+            if settings["concurrency"] is None or self._running[job_type] < settings["concurrency"]
+        ]
+
+    async def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Lease the next due job (or one whose lease expired) of a type with free capacity
+
+        A claimed job holds a slot of its type's concurrency until process() has run it.
+        """
+        job_types = self._claimable_types()
+        if not job_types:
+            return None
+        # Reserve a slot of every candidate type before awaiting the claim, so workers claiming
+        # concurrently can't all see the same free slot and overshoot a type's limit
+        for job_type in job_types:
+            self._running[job_type] += 1
+        job = None
+        try:
+            now = datetime.utcnow()
+            job = await get_database()[QUEUE_COLLECTION].find_one_and_update(
+                {
+                    "type": {"$in": job_types},
+                    "$or": [
+                        {"status": "queued", "available_at": {"$lte": now}},
+                        {"status": "running", "lease_until": {"$lt": now}}
+                    ]
+                },
+                {
+                    "$set": {
+                        "status": "running",
+                        "lease_until": now + timedelta(seconds=self.lease_seconds),
+                        "lease_token": str(uuid.uuid4()),
+                        "worker": worker,
+                        "started_at": now,
+                        "updated_at": now
+                    },
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("priority", -1), ("available_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            return job
+        finally:
+            for job_type in job_types:
+                if job is None or job_type != job["type"]:
+                    self._running[job_type] -= 1
+            if job is not None and len(job_types) > 1:
+                # Slots held only for the claim are free again for workers idling on the limit
+                self._wakeup.set()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _finish(self, job: Dict[str, Any], update: Dict[str, Any]):
+        # The lease token guards against overwriting a job another worker re-claimed after our lease expired
+        await get_database()[QUEUE_COLLECTION].update_one(
+            {"id": job["id"], "lease_token": job["lease_token"]},
+            {"$set": {**update, "updated_at": datetime.utcnow()}, "$unset": {"lease_until": "", "lease_token": ""}}
+        )
+        self._notify(job["id"])
+
+    async def _heartbeat(self, job: Dict[str, Any]):
+        # Renew the lease well before it runs out; stop once another worker has taken the job over
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            result = await get_database()[QUEUE_COLLECTION].update_one(
+                {"id": job["id"], "lease_token": job["lease_token"]},
+                {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)}}
+            )
+            if not result.modified_count:
+                return
+
+    async def _dead_letter(self, job: Dict[str, Any], error: str, exception: Optional[Exception] = None):
+        self.dead_lettered += 1
+        update = {"status": "dead", "last_error": error, "dead_at": datetime.utcnow()}
+        settings = self._types.get(job["type"], {})
+        if settings.get("compensate"):
+            compensated = None
+            if isinstance(exception, settings["not_applied"]):
+                try:
+                    compensated = bool(await settings["compensate"](job["payload"]))
+                except Exception as e:
+                    print(f"Error compensating job {job['id']} ({job['type']}): {e}")
+            if compensated is None:
+                # The handler may or may not have taken effect (or compensating failed): leave it to an admin
+                self.unreconciled += 1
+                update["needs_reconciliation"] = True
+                print(f"Job {job['id']} ({job['type']}) needs reconciliation: {error}")
+            elif compensated:
+                self.compensated += 1
+                update["compensated"] = True
+        await self._finish(job, update)
+
+    async def process(self, job: Dict[str, Any]):
+        """Run a claimed job, record its outcome and free the slot its claim reserved"""
+        try:
+            await self._run(job)
+        finally:
+            self._running[job["type"]] -= 1
+
+    async def _run(self, job: Dict[str, Any]):
+        settings = self._types.get(job["type"])
+        if job["attempts"] > job["max_attempts"]:
+            # Its last attempt was claimed by a worker that died mid-run; don't start another
+            await self._dead_letter(job, job.get("last_error") or "Lease expired on the final attempt")
+            return
+
+        self._notify(job["id"])
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            if settings is None:
+                raise LookupError(f"No handler registered for job type {job['type']}")
+            result = await asyncio.wait_for(settings["handler"](job["payload"]), settings["timeout"])
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            print(f"Error processing job {job['id']} ({job['type']}, attempt {job['attempts']}): {error}")
+            if job["attempts"] >= job["max_attempts"]:
+                await self._dead_letter(job, error, e)
+            else:
+                self.retried += 1
+                delay = self._backoff(job["attempts"])
+                await self._finish(job, {
+                    "status": "queued",
+                    "last_error": error,
+                    "available_at": datetime.utcnow() + timedelta(seconds=delay)
+                })
+            return
+        finally:
+            heartbeat.cancel()
+
+        self.completed += 1
+        await self._finish(job, {"status": "done", "result": result, "finished_at": datetime.utcnow()})
+
+    async def _worker(self, name: str):
+        while not self._stopping:
+            try:
+                job = await self.claim(name)
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.process(job)
+            # A slot of this job's type is free again for workers idling on the concurrency limit
+            self._wakeup.set()
+
+    async def start(self):
+        """Start the worker tasks"""
+        if not self.enabled or self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker(f"{os.getpid()}-{index}")) for index in range(self.workers)]
+
+    async def stop(self):
+        """Let in-flight jobs finish (up to the grace period), then stop the workers"""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=self.shutdown_grace)
+        for task in pending:
+            # Their leases expire and another worker picks the jobs up again
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    def _notify(self, job_id: str):
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+
+    async def get_job(self, job_id: str, view: str = "status") -> Optional[Dict[str, Any]]:
+        """A job as seen through a registered projection"""
+        return await get_database()[QUEUE_COLLECTION].find_one({"id": job_id}, projection(QUEUE_COLLECTION, view))
+
+    async def watch(
+        self,
+        job_id: str,
+        poll_interval: Optional[float] = None,
+        keepalive: Optional[float] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield the job every time its status or attempt count changes, ending at a terminal status
+
+        Changes made by this process wake the watcher at once; others are picked up by polling.
+        With keepalive, None is yielded after that many seconds without a change.
+        """
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(event)
+        last_seen = None
+        loop_time = asyncio.get_running_loop().time
+        last_yield = loop_time()
+        try:
+            while True:
+                event.clear()
+                job = await self.get_job(job_id)
+                if job is None:
+                    return
+                seen = (job["status"], job["attempts"])
+                if seen != last_seen:
+                    last_seen = seen
+                    last_yield = loop_time()
+                    yield job
+                elif keepalive and loop_time() - last_yield >= keepalive:
+                    last_yield = loop_time()
+                    yield None
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), poll_interval or self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._watchers[job_id].discard(event)
+            if not self._watchers[job_id]:
+                del self._watchers[job_id]
+
+    async def retry_dead(self, job_id: str) -> bool:
+        """Put a dead-lettered job back on the queue with a fresh attempt budget
+
+        Compensated jobs stay dead: running them again would redo only half of the work.
+        """
+        result = await get_database()[QUEUE_COLLECTION].update_one(
+            {"id": job_id, "status": "dead", "compensated": {"$ne": True}},
+            {"$set": {"status": "queued", "attempts": 0, "available_at": datetime.utcnow(), "updated_at": datetime.utcnow()},
+             "$unset": {"dead_at": "", "needs_reconciliation": ""}}
+        )
+        if result.modified_count:
+            self._wakeup.set()
+            self._notify(job_id)
+        return bool(result.modified_count)
+
+    async def reconcile(self, job_id: str, applied: bool) -> bool:
+        """Resolve a job flagged needs_reconciliation after an admin checked whether it took effect
+
+        applied=False runs the job type's compensation; applied=True keeps what the job did.
+        """
+        collection = get_database()[QUEUE_COLLECTION]
+        job = await collection.find_one({"id": job_id, "status": "dead", "needs_reconciliation": True}, {"_id": 0})
+        if not job:
+            return False
+        update: Dict[str, Any] = {"reconciled_at": datetime.utcnow(), "updated_at": datetime.utcnow()}
+        compensate = self._types.get(job["type"], {}).get("compensate")
+        if not applied and compensate and await compensate(job["payload"]):
+            self.compensated += 1
+            update["compensated"] = True
+        await collection.update_one(
+            {"id": job_id, "needs_reconciliation": True},
+            {"$set": update, "$unset": {"needs_reconciliation": ""}}
+        )
+        self._notify(job_id)
+        return True
+
+    async def get_counts(self) -> Dict[str, int]:
+        """Number of jobs per status, plus the dead ones awaiting reconciliation"""
+        collection = get_database()[QUEUE_COLLECTION]
+        rows = await collection.aggregate([
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        counts = {row["_id"]: row["count"] for row in rows}
+        counts["needs_reconciliation"] = await collection.count_documents({"needs_reconciliation": True})
+        return counts
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get worker counters"""
+        return {
+            "workers": len(self._tasks),
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "compensated": self.compensated,
+            "unreconciled": self.unreconciled,
+            "running": {job_type: count for job_type, count in self._running.items() if count},
+            "types": {
+                job_type: {"concurrency": settings["concurrency"], "timeout": settings["timeout"]}
+                for job_type, settings in sorted(self._types.items())
+            }
+        }
+
+# Global instance
+work_queue = WorkQueue()
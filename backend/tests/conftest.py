@@ -0,0 +1,27 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import database
+
+@pytest.fixture
+def mongo():
+    """Point the app's database at a fresh in-memory mongomock database"""
+    client = AsyncMongoMockClient()
+    previous = (database.db.client, database.db.database)
+    database.db.client = client
+    database.db.database = client.test_crib_markets
+    yield database.db.database
+    database.db.client, database.db.database = previous
+
+@pytest.fixture
+def run():
+    """Run coroutines to completion on one event loop shared by the whole test"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
@@ -0,0 +1,129 @@
+import pytest
+
+import database
+from services.ledger_service import (
+    LedgerService, LEDGER_COLLECTION, ADJUSTMENTS_ACCOUNT, STRIPE_ACCOUNT, WITHDRAWALS_ACCOUNT,
+    InsufficientFundsError, DuplicateTransactionError, user_account
+)
+
+@pytest.fixture
+def ledger(run, mongo, monkeypatch):
+    """Standalone-mode ledger over a database with one user holding 100.0"""
+    monkeypatch.setenv("LEDGER_TRANSACTIONS", "false")
+
+    async def setup():
+        await mongo[LEDGER_COLLECTION].create_indexes(database.INDEXES[LEDGER_COLLECTION])
+        await mongo.users.insert_one({"id": "u1", "balance": 100.0})
+
+    run(setup())
+    return LedgerService()
+
+@pytest.fixture
+def balance(run, mongo):
+    """Current wallet balance of the test user"""
+    return lambda: run(mongo.users.find_one({"id": "u1"}))["balance"]
+
+@pytest.fixture
+def entries(run, mongo):
+    """All ledger entries written so far"""
+    return lambda: run(mongo[LEDGER_COLLECTION].find({}, {"_id": 0}).to_list(None))
+
+def test_post_writes_balanced_entries(run, ledger, balance, entries):
+    result = run(ledger.post("u1", -40.0, WITHDRAWALS_ACCOUNT, "withdrawal"))
+
+    assert result["balance"] == 60.0
+    assert balance() == 60.0
+    rows = entries()
+    assert {row["account"]: row["amount"] for row in rows} == {user_account("u1"): -40.0, WITHDRAWALS_ACCOUNT: 40.0}
+    assert {row["txn_id"] for row in rows} == {result["txn_id"]}
+
+def test_overdraft_is_rejected_without_side_effects(run, ledger, balance, entries):
+    with pytest.raises(InsufficientFundsError):
+        run(ledger.post("u1", -100.01, WITHDRAWALS_ACCOUNT, "withdrawal"))
+
+    assert balance() == 100.0
+    assert entries() == []
+    assert ledger.rejected == 1
+
+def test_allow_negative_permits_overdraft(run, ledger, balance):
+    run(ledger.post("u1", -150.0, ADJUSTMENTS_ACCOUNT, "adjustment", allow_negative=True))
+
+    assert balance() == -50.0
+
+def test_duplicate_txn_id_is_rejected_before_the_balance_moves(run, ledger, balance, entries, mongo, monkeypatch):
+    run(ledger.post("u1", 25.0, STRIPE_ACCOUNT, "deposit", txn_id="deposit:p1"))
+
+    users_class = type(mongo.users)
+    original_find_one_and_update = users_class.find_one_and_update
+    balance_updates = []
+
+    async def recording_find_one_and_update(self, *args, **kwargs):
+        balance_updates.append(args)
+        return await original_find_one_and_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(users_class, "find_one_and_update", recording_find_one_and_update)
+
+    with pytest.raises(DuplicateTransactionError):
+        run(ledger.post("u1", 25.0, STRIPE_ACCOUNT, "deposit", txn_id="deposit:p1"))
+
+    assert balance_updates == []
+    assert balance() == 125.0
+    assert len(entries()) == 2
+    assert ledger.compensated == 0
+
+def test_failed_entry_insert_leaves_balance(run, ledger, balance, mongo, monkeypatch):
+    collection_class = type(mongo[LEDGER_COLLECTION])
+
+    async def failing_insert_many(self, *args, **kwargs):
+        raise ConnectionError("connection reset while writing entries")
+
+    monkeypatch.setattr(collection_class, "insert_many", failing_insert_many)
+
+    with pytest.raises(ConnectionError):
+        run(ledger.post("u1", -30.0, WITHDRAWALS_ACCOUNT, "withdrawal"))
+
+    assert balance() == 100.0
+    assert ledger.posted == 0
+
+def test_failed_balance_update_removes_entries(run, ledger, balance, entries, mongo, monkeypatch):
+    async def failing_find_one_and_update(self, *args, **kwargs):
+        raise ConnectionError("connection reset while moving the balance")
+
+    monkeypatch.setattr(type(mongo.users), "find_one_and_update", failing_find_one_and_update)
+
+    with pytest.raises(ConnectionError):
+        run(ledger.post("u1", -30.0, WITHDRAWALS_ACCOUNT, "withdrawal"))
+
+    assert balance() == 100.0
+    assert entries() == []
+    assert ledger.compensated == 1
+
+def test_set_balance_retries_after_concurrent_change(run, ledger, balance, entries, mongo, monkeypatch):
+    users_class = type(mongo.users)
+    original_find_one = users_class.find_one
+    reads = []
+
+    async def find_one_then_race(self, *args, **kwargs):
+        document = await original_find_one(self, *args, **kwargs)
+        reads.append(document)
+        if len(reads) == 1:
+            # Another writer moves the balance between set_balance's read and its compare-and-set
+            await self.update_one({"id": "u1"}, {"$inc": {"balance": 5.0}})
+        return document
+
+    monkeypatch.setattr(users_class, "find_one", find_one_then_race)
+
+    result = run(ledger.set_balance("u1", 80.0))
+
+    assert result["balance"] == 80.0
+    assert balance() == 80.0
+    assert ledger.rejected == 1
+    adjustment = [row for row in entries() if row["account"] == user_account("u1")]
+    assert [row["amount"] for row in adjustment] == [-25.0]
+
+def test_ledger_matches_balances_after_opening_entries(run, ledger):
+    run(ledger.post("u1", 10.0, STRIPE_ACCOUNT, "deposit"))
+    assert run(ledger.find_drift()) == [{"user_id": "u1", "balance": 110.0, "ledger": 10.0}]
+
+    assert run(ledger.record_opening_balances()) == 1
+    assert run(ledger.find_drift()) == []
@@ -0,0 +1,110 @@
+import httpx
+import pytest
+
+import database
+from services import mt5_jobs
+from services.ledger_service import ledger_service, LEDGER_COLLECTION, mt5_account
+from services.mt5_service import mt5_service, MT5BridgeError, MT5NotAppliedError
+from services.work_queue import work_queue, QUEUE_COLLECTION
+
+@pytest.fixture
+def wallet(run, mongo, monkeypatch):
+    """A user who moved 40.0 of a 100.0 wallet to MT5 login 1001, the way /mt5/balance does"""
+    monkeypatch.setattr(ledger_service, "transactions", "false")
+
+    async def setup():
+        await mongo[LEDGER_COLLECTION].create_indexes(database.INDEXES[LEDGER_COLLECTION])
+        await mongo.users.insert_one({"id": "u1", "balance": 100.0})
+        return await ledger_service.post("u1", -40.0, mt5_account(1001), "mt5_balance")
+
+    return run(setup())
+
+@pytest.fixture
+def balance_job(run, mongo, wallet, monkeypatch):
+    """Run one mt5.balance_operation job whose bridge call fails with the given error"""
+    def run_job(error, with_ledger=True):
+        async def failing_balance_operation(**kwargs):
+            raise error
+
+        monkeypatch.setattr(mt5_jobs.mt5_service, "apply_balance_operation", failing_balance_operation)
+        payload = {"login_id": 1001, "amount": -40.0, "txn_type": 1}
+        if with_ledger:
+            payload["ledger"] = {"user_id": "u1", "txn_id": wallet["txn_id"]}
+
+        async def scenario():
+            queued = await work_queue.enqueue("mt5.balance_operation", payload, user_id="u1")
+            await work_queue.process(await work_queue.claim("w"))
+            assert await work_queue.claim("w") is None
+            return await mongo[QUEUE_COLLECTION].find_one({"id": queued["id"]}, {"_id": 0})
+
+        return run(scenario())
+
+    return run_job
+
+def user_balance(run, mongo) -> float:
+    return run(mongo.users.find_one({"id": "u1"}))["balance"]
+
+def test_unsent_balance_operation_reverses_the_wallet(run, mongo, balance_job):
+    job = balance_job(MT5NotAppliedError("balanceOP not sent: circuit open"))
+
+    assert job["status"] == "dead"
+    assert job["compensated"] is True
+    assert "needs_reconciliation" not in job
+    assert user_balance(run, mongo) == 100.0
+    # Re-running it would move MT5 without the wallet
+    assert run(work_queue.retry_dead(job["id"])) is False
+
+def test_unknown_outcome_waits_for_reconciliation(run, mongo, balance_job):
+    job = balance_job(httpx.ReadTimeout("no response"))
+
+    assert job["status"] == "dead"
+    assert job["needs_reconciliation"] is True
+    assert "compensated" not in job
+    assert user_balance(run, mongo) == 60.0
+    assert run(work_queue.get_counts())["needs_reconciliation"] == 1
+
+    # The admin found MT5 never booked it
+    assert run(work_queue.reconcile(job["id"], applied=False)) is True
+    assert user_balance(run, mongo) == 100.0
+    job = run(mongo[QUEUE_COLLECTION].find_one({"id": job["id"]}))
+    assert job["compensated"] is True
+    assert "needs_reconciliation" not in job
+    assert run(work_queue.reconcile(job["id"], applied=False)) is False
+    assert user_balance(run, mongo) == 100.0
+
+def test_applied_reconciliation_keeps_the_wallet(run, mongo, balance_job):
+    job = balance_job(MT5BridgeError("balanceOP returned 502"))
+
+    assert run(work_queue.reconcile(job["id"], applied=True)) is True
+    assert user_balance(run, mongo) == 60.0
+    assert "compensated" not in run(mongo[QUEUE_COLLECTION].find_one({"id": job["id"]}))
+
+def test_unsent_deposit_without_wallet_side_can_be_retried(run, balance_job):
+    # Stripe deposits credit MT5 without debiting the wallet, so there is nothing to reverse
+    job = balance_job(MT5NotAppliedError("balanceOP rejected with 400"), with_ledger=False)
+
+    assert job["status"] == "dead"
+    assert "compensated" not in job
+    assert run(work_queue.retry_dead(job["id"])) is True
+
+@pytest.mark.parametrize("error, not_applied", [
+    (httpx.ConnectError("connection refused"), True),
+    (httpx.ReadTimeout("no response"), False),
+])
+def test_bridge_errors_are_classified_by_whether_the_request_was_sent(run, monkeypatch, error, not_applied):
+    async def failing_request(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(mt5_service, "_session_request", failing_request)
+    with pytest.raises(MT5NotAppliedError if not_applied else type(error)):
+        run(mt5_service.apply_balance_operation(1001, 10.0, 0, "Deposit"))
+
+@pytest.mark.parametrize("status_code, expected", [(400, MT5NotAppliedError), (502, MT5BridgeError)])
+def test_bridge_responses_are_classified_by_status(run, monkeypatch, status_code, expected):
+    async def responding_request(*args, **kwargs):
+        return httpx.Response(status_code)
+
+    monkeypatch.setattr(mt5_service, "_session_request", responding_request)
+    with pytest.raises(expected) as raised:
+        run(mt5_service.apply_balance_operation(1001, 10.0, 0, "Deposit"))
+    assert raised.type is expected
@@ -0,0 +1,57 @@
+import pytest
+
+import database
+from services import stripe_webhooks
+from services.stripe_webhooks import accept_event, EVENTS_COLLECTION
+from services.work_queue import QUEUE_COLLECTION
+
+EVENT = {
+    "id": "evt_1",
+    "type": "checkout.session.completed",
+    "data": {"object": {"id": "cs_1"}}
+}
+
+@pytest.fixture
+def indexed(run, mongo):
+    async def setup():
+        for name in (QUEUE_COLLECTION, EVENTS_COLLECTION):
+            await mongo[name].create_indexes(database.INDEXES[name])
+
+    run(setup())
+    return mongo
+
+def test_redelivered_event_is_queued_once(run, indexed):
+    assert run(accept_event(EVENT)) is True
+    assert run(accept_event(EVENT)) is False
+
+    assert run(indexed[QUEUE_COLLECTION].count_documents({"type": "stripe.checkout_completed"})) == 1
+    assert run(indexed[EVENTS_COLLECTION].count_documents({})) == 1
+
+def test_event_is_not_recorded_when_enqueue_fails(run, indexed, monkeypatch):
+    async def failing_enqueue(*args, **kwargs):
+        raise ConnectionError("queue unavailable")
+
+    monkeypatch.setattr(stripe_webhooks.work_queue, "enqueue", failing_enqueue)
+    with pytest.raises(ConnectionError):
+        run(accept_event(EVENT))
+    assert run(indexed[EVENTS_COLLECTION].count_documents({})) == 0
+
+    # Stripe's retry queues the job this time
+    monkeypatch.undo()
+    assert run(accept_event(EVENT)) is True
+    assert run(indexed[QUEUE_COLLECTION].count_documents({})) == 1
+
+def test_crash_after_enqueue_does_not_lose_or_duplicate_the_job(run, indexed, monkeypatch):
+    events_class = type(indexed[EVENTS_COLLECTION])
+    original_insert_one = events_class.insert_one
+
+    async def crashing_insert_one(self, *args, **kwargs):
+        raise ConnectionError("connection reset")
+
+    monkeypatch.setattr(events_class, "insert_one", crashing_insert_one)
+    with pytest.raises(ConnectionError):
+        run(accept_event(EVENT))
+
+    monkeypatch.setattr(events_class, "insert_one", original_insert_one)
+    assert run(accept_event(EVENT)) is True
+    assert run(indexed[QUEUE_COLLECTION].count_documents({})) == 1
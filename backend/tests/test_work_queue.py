@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from services.work_queue import WorkQueue, QUEUE_COLLECTION
+
+@pytest.fixture
+def queue(mongo, monkeypatch):
+    monkeypatch.setenv("WORK_QUEUE_WORKERS", "6")
+    monkeypatch.setenv("WORK_QUEUE_POLL_INTERVAL", "0.01")
+    return WorkQueue()
+
+@pytest.fixture
+def slow_claims(mongo, monkeypatch):
+    """Delay every find_one_and_update, as a remote database would"""
+    collection_class = type(mongo[QUEUE_COLLECTION])
+    original = collection_class.find_one_and_update
+
+    async def delayed(self, *args, **kwargs):
+        await asyncio.sleep(0.02)
+        return await original(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_class, "find_one_and_update", delayed)
+
+async def drain(queue: WorkQueue, mongo, job_count: int):
+    await queue.start()
+    while await mongo[QUEUE_COLLECTION].count_documents({"status": "done"}) < job_count:
+        await asyncio.sleep(0.01)
+    await queue.stop()
+
+def test_concurrent_workers_respect_type_concurrency(run, queue, mongo, slow_claims):
+    in_flight = {"now": 0, "peak": 0}
+
+    async def handler(payload):
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        await asyncio.sleep(0.05)
+        in_flight["now"] -= 1
+
+    queue.register("test.limited", handler, concurrency=2)
+
+    async def scenario():
+        for index in range(10):
+            await queue.enqueue("test.limited", {"index": index})
+        await drain(queue, mongo, 10)
+
+    run(scenario())
+
+    assert in_flight["peak"] == 2
+    assert queue.completed == 10
+    assert queue.get_metrics()["running"] == {}
+
+def test_claim_releases_reserved_slots(run, queue, mongo, slow_claims):
+    async def handler(payload):
+        return payload
+
+    queue.register("test.limited", handler, concurrency=1)
+    queue.register("test.other", handler)
+
+    async def scenario():
+        assert await queue.claim("w") is None
+
+        await queue.enqueue("test.other", {})
+        job = await queue.claim("w")
+        assert job["type"] == "test.other"
+        assert queue._running == {"test.limited": 0, "test.other": 1}
+        await queue.process(job)
+
+    run(scenario())
+
+    assert queue._running == {"test.limited": 0, "test.other": 0}
+
+def test_failed_claim_releases_reserved_slots(run, queue, mongo, monkeypatch):
+    async def handler(payload):
+        return payload
+
+    async def failing_claim(self, *args, **kwargs):
+        raise ConnectionError("connection reset")
+
+    queue.register("test.limited", handler, concurrency=1)
+    monkeypatch.setattr(type(mongo[QUEUE_COLLECTION]), "find_one_and_update", failing_claim)
+
+    with pytest.raises(ConnectionError):
+        run(queue.claim("w"))
+    assert queue._running == {"test.limited": 0}
@@ -1,39 +1,76 @@
+import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from database import get_database
 from services.auth_service import auth_service
-from models.user import UserInDB
+from models.user import UserInDB, TokenPrincipal
+from utils.cache import TTLCache
 from typing import Optional
 
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInDB:
-    """Get current authenticated user"""
-    credentials_exception = HTTPException(
+# Per-process cache of authenticated users, keyed by user id
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+_user_cache = TTLCache(max_size=int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000")))
+
+# Opt-in: let read-only endpoints trust the role/is_active claims signed into the token
+TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+def invalidate_user(user_id: str):
+    """Drop a user from the auth cache after their record changed"""
+    _user_cache.delete(user_id)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def _decode_token(credentials: HTTPAuthorizationCredentials) -> dict:
     try:
         payload = auth_service.verify_token(credentials.credentials)
-        if payload is None:
-            raise credentials_exception
-        
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
+        if payload is None or payload.get("sub") is None:
+            raise _credentials_exception()
+        return payload
     except Exception:
-        raise credentials_exception
-    
+        raise _credentials_exception()
+
+async def _load_user(user_id: str) -> UserInDB:
+    found, user, _ = _user_cache.get(user_id)
+    if found:
+        return user
+
     # Get user from database
     db = get_database()
     user_doc = await db.users.find_one({"id": user_id})
     
     if user_doc is None:
-        raise credentials_exception
+        raise _credentials_exception()
     
-    return UserInDB(**user_doc)
+    user = UserInDB(**user_doc)
+    _user_cache.set(user_id, user, USER_CACHE_TTL_SECONDS)
+    return user
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> UserInDB:
+    """Get current authenticated user"""
+    payload = _decode_token(credentials)
+    return await _load_user(payload["sub"])
+
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenPrincipal:
+    """Get the authenticated caller's id/role/status, from signed claims when trusted"""
+    payload = _decode_token(credentials)
+    if TRUST_TOKEN_CLAIMS and "role" in payload and "is_active" in payload:
+        return TokenPrincipal(id=payload["sub"], role=payload["role"], is_active=payload["is_active"])
+
+    user = await _load_user(payload["sub"])
+    return TokenPrincipal(id=user.id, role=user.role, is_active=user.is_active)
+
+async def get_current_active_principal(principal: TokenPrincipal = Depends(get_current_principal)) -> TokenPrincipal:
+    """Get active caller for read-only endpoints that only need the user id"""
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
     """Get current active user"""
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+class TTLCache:
+    """In-process LRU cache with per-entry TTL and a stale-while-revalidate window"""
+
+    def __init__(self, max_size: int = 1000, stale_ttl: float = 0.0):
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, allow_stale: bool = False) -> Tuple[bool, Any, bool]:
+        """Look up key; returns (found, value, fresh). allow_stale returns entries of any age"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None, False
+
+        value, expires_at = entry
+        now = time.monotonic()
+        if now < expires_at:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value, True
+        if allow_stale or now < expires_at + self.stale_ttl:
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            return True, value, False
+
+        # Too old for normal reads, but kept (LRU-bounded) as a last-resort fallback
+        self.misses += 1
+        return False, None, False
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        """Store value for ttl seconds, evicting the least recently used entry if full"""
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """Remove key from the cache"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get hit/miss counters"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0
+        }
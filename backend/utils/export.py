@@ -0,0 +1,69 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Any, List
+from fastapi.responses import StreamingResponse
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Encoded rows are buffered up to roughly this many bytes before being sent
+EXPORT_FLUSH_BYTES = int(os.getenv("EXPORT_FLUSH_BYTES", "65536"))
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+async def encode_rows(cursor, columns: List[str], fmt: str) -> AsyncIterator[bytes]:
+    """Encode cursor rows as CSV (with header) or NDJSON, yielding buffered chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    async for row in cursor:
+        if writer:
+            writer.writerow([_cell(row.get(column)) for column in columns])
+        else:
+            buffer.write(json.dumps({column: _cell(row.get(column)) for column in columns}, default=str))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a byte stream incrementally into a single gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_response(cursor, columns: List[str], fmt: str, name: str, gzip: bool = False) -> StreamingResponse:
+    """StreamingResponse that encodes a Motor cursor as a downloadable export"""
+    media_type, extension = EXPORT_FORMATS[fmt]
+    body = encode_rows(cursor.batch_size(EXPORT_BATCH_SIZE), columns, fmt)
+    file_name = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.{extension}"
+    if gzip:
+        body = gzip_chunks(body)
+        media_type = "application/gzip"
+        file_name += ".gz"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'}
+    )
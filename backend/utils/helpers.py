@@ -42,6 +42,29 @@ def get_file_as_base64(file_path: str) -> Optional[str]:
         print(f"Error reading file: {e}")
         return None
 
+def parse_byte_range(range_header: Optional[str], size: int) -> Optional[tuple]:
+    """Parse a single "bytes=start-end" range into inclusive (start, end); None means send the whole body
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    import re
+    match = re.match(r'^bytes=(\d*)-(\d*)$', (range_header or "").strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # Missing, malformed or multi-range headers are ignored
+        return None
+    start_text, end_text = match.groups()
+    if start_text == "":
+        # Suffix range: the last N bytes
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = min(int(end_text), size - 1) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
 def validate_email(email: str) -> bool:
     """Validate email format"""
     import re
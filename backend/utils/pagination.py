@@ -0,0 +1,85 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from fastapi import HTTPException, Query, Response, status
+from database import get_database
+from utils.queries import projection
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# Response header carrying the cursor of the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class PageParams:
+    """Decoded cursor position and page size of a paginated list request"""
+
+    def __init__(self, after: Optional[Tuple[Optional[datetime], str]], limit: int):
+        self.after = after
+        self.limit = limit
+
+def page_params(
+    cursor: Optional[str] = Query(None, description=f"Opaque cursor from the {NEXT_CURSOR_HEADER} response header"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> PageParams:
+    """FastAPI dependency for keyset-paginated list endpoints"""
+    # Decoded here so a bad cursor is a 400 before the handler runs
+    return PageParams(decode_cursor(cursor) if cursor else None, limit)
+
+def encode_cursor(sort_value: Optional[datetime], doc_id: str) -> str:
+    """Opaque cursor pointing just past (sort_value, doc_id); sort_value is None for legacy rows without it"""
+    payload = json.dumps(
+        {"t": sort_value.isoformat() if sort_value is not None else None, "id": doc_id},
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    """Inverse of encode_cursor; raises 400 for anything malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        sort_value = datetime.fromisoformat(payload["t"]) if payload["t"] is not None else None
+        return sort_value, str(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def find_page(
+    collection: str,
+    view: str,
+    query: Dict[str, Any],
+    page: PageParams,
+    response: Response,
+    sort_field: str = "created_at"
+) -> List[Dict[str, Any]]:
+    """Newest-first keyset page over (sort_field, id) using a registered projection
+
+    Sets the next-page cursor header on the response when more rows exist.
+    """
+    if page.after:
+        sort_value, doc_id = page.after
+        if sort_value is None:
+            # Rows missing the sort field sort last (null is lowest); page through them by id alone
+            keyset = {sort_field: None, "id": {"$lt": doc_id}}
+        else:
+            keyset = {"$or": [
+                {sort_field: {"$lt": sort_value}},
+                {sort_field: sort_value, "id": {"$lt": doc_id}},
+                # $lt never matches null, so legacy rows would otherwise be skipped
+                {sort_field: None}
+            ]}
+        query = {"$and": [query, keyset]} if query else keyset
+
+    rows = await get_database()[collection].find(query, projection(collection, view)) \
+        .sort([(sort_field, -1), ("id", -1)]) \
+        .limit(page.limit + 1) \
+        .to_list(page.limit + 1)
+
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].get(sort_field), rows[-1]["id"])
+    return rows
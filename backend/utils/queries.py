@@ -0,0 +1,86 @@
+from typing import Dict, Any, List, Optional, Tuple
+from database import get_database
+
+# Characters of the latest ticket message included in list views
+MESSAGE_PREVIEW_CHARS = 140
+
+# Declarative projection registry: (collection, view) -> fields that view needs.
+# List endpoints read through these so blobs and embedded arrays never leave the server.
+PROJECTIONS: Dict[Tuple[str, str], Dict[str, Any]] = {
+    ("documents", "summary"): {
+        "_id": 0, "id": 1, "user_id": 1, "document_type": 1, "file_name": 1, "mime_type": 1,
+        "size": 1, "status": 1, "uploaded_at": 1, "reviewed_at": 1, "reviewer_notes": 1,
+        "preview_status": 1, "previews": 1
+    },
+    ("documents", "status"): {"_id": 0, "id": 1, "user_id": 1, "status": 1},
+    ("tickets", "summary"): {
+        "_id": 0, "id": 1, "user_id": 1, "subject": 1, "description": 1, "category": 1, "priority": 1,
+        "status": 1, "created_at": 1, "updated_at": 1, "closed_at": 1, "assigned_to": 1,
+        "message_count": {"$size": {"$ifNull": ["$messages", []]}},
+        "last_message": {"$let": {
+            "vars": {"last": {"$arrayElemAt": ["$messages", -1]}},
+            "in": {"$cond": [
+                {"$ifNull": ["$$last", False]},
+                {
+                    "user_name": "$$last.user_name",
+                    "user_role": "$$last.user_role",
+                    "created_at": "$$last.created_at",
+                    "preview": {"$substrCP": [{"$ifNull": ["$$last.message", ""]}, 0, MESSAGE_PREVIEW_CHARS]}
+                },
+                None
+            ]}
+        }}
+    },
+    ("payments", "summary"): {
+        "_id": 0, "id": 1, "user_id": 1, "amount": 1, "currency": 1, "method": 1, "status": 1,
+        "reference": 1, "created_at": 1, "updated_at": 1
+    },
+    ("payments", "export"): {
+        "_id": 0, "id": 1, "user_id": 1, "amount": 1, "currency": 1, "method": 1, "status": 1,
+        "reference": 1, "mt5_transaction_id": 1, "created_at": 1, "updated_at": 1
+    },
+    ("users", "export"): {
+        "_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1, "country": 1, "city": 1, "address": 1,
+        "balance": 1, "role": 1, "kyc_status": 1, "is_active": 1, "created_at": 1
+    },
+    ("work_queue", "summary"): {
+        "_id": 0, "id": 1, "type": 1, "payload": 1, "status": 1, "priority": 1, "attempts": 1, "max_attempts": 1,
+        "user_id": 1, "available_at": 1, "last_error": 1, "result": 1, "created_at": 1, "updated_at": 1,
+        "started_at": 1, "finished_at": 1, "dead_at": 1, "needs_reconciliation": 1, "compensated": 1, "reconciled_at": 1
+    },
+    # What a job's owner may see: no payload (it can carry credentials, e.g. new MT5 account passwords)
+    ("work_queue", "status"): {
+        "_id": 0, "id": 1, "type": 1, "status": 1, "attempts": 1, "max_attempts": 1, "user_id": 1,
+        "available_at": 1, "last_error": 1, "result": 1, "created_at": 1, "updated_at": 1,
+        "started_at": 1, "finished_at": 1, "dead_at": 1, "compensated": 1
+    },
+    ("users", "summary"): {
+        "_id": 0, "id": 1, "name": 1, "email": 1, "phone": 1, "country": 1, "city": 1, "address": 1,
+        "balance": 1, "role": 1, "kyc_status": 1, "is_active": 1, "created_at": 1, "mt5_accounts": 1
+    },
+}
+
+def projection(collection: str, view: str) -> Dict[str, Any]:
+    """Projection registered for a collection view"""
+    return PROJECTIONS[(collection, view)]
+
+def view_fields(collection: str, view: str) -> List[str]:
+    """Field names a view returns, in declaration order"""
+    return [field for field in projection(collection, view) if field != "_id"]
+
+async def find_view(
+    collection: str,
+    view: str,
+    query: Dict[str, Any],
+    sort: Optional[List[Tuple[str, int]]] = None,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Run a find that returns only the fields of the named view"""
+    cursor = get_database()[collection].find(query, projection(collection, view))
+    if sort:
+        cursor = cursor.sort(sort)
+    return await cursor.to_list(limit)
+
+async def find_one_view(collection: str, view: str, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """find_one restricted to the fields of the named view"""
+    return await get_database()[collection].find_one(query, projection(collection, view))
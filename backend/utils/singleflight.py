@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one in-flight call"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn for key, or await the call already in flight for that key"""
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so one cancelled caller doesn't cancel the shared call for the others
+        return await asyncio.shield(future)
+
+    def in_flight(self) -> int:
+        """Number of calls currently in flight"""
+        return len(self._inflight)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get call and deduplication counters"""
+        return {
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+            "upstream_calls": self.calls - self.deduplicated,
+            "in_flight": len(self._inflight)
+        }